@@ -3,9 +3,13 @@ import os
 from flask import Flask
 from routes import routes
 from database import db  # Import the db instance
-from flask_migrate import Migrate
+import metrics
 
-def create_app():
+def create_app(migrations=True):
+    """
+    Builds the Flask app.
+    :param migrations: Register Flask-Migrate; the production entry point (wsgi.py) skips it.
+    """
     app = Flask(__name__)
     
     # Load configuration
@@ -13,19 +17,64 @@ def create_app():
         SECRET_KEY=os.getenv("SECRET_KEY", "your_default_secret_key"),
         SQLALCHEMY_DATABASE_URI=os.getenv("DATABASE_URL", "sqlite:///ride_matching.db"),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        METRICS_ENABLED=os.getenv("METRICS_ENABLED", "True") == "True",
+        TIMING_HEADER=os.getenv("TIMING_HEADER", "False") == "True",
+        ETA_MATRIX_PATH=os.getenv("ETA_MATRIX_PATH"),
+        ROUTE_OSRM_TIMEOUT=float(os.getenv("ROUTE_OSRM_TIMEOUT", "5")),  # /api/route answers 504 past this
+        MATCH_TOP_K=int(os.getenv("MATCH_TOP_K", "5")),
+        MATCH_MAX_SPEED_KMH=float(os.getenv("MATCH_MAX_SPEED_KMH", "90")),
+        MATCH_OSRM_TIMEOUT=float(os.getenv("MATCH_OSRM_TIMEOUT", "2")),  # Slower live ETAs use the ETA matrix
+        MATCH_SHARDS=int(os.getenv("MATCH_SHARDS", "0")),  # 0 matches in-process, N>0 uses the host's shard service
+        MATCH_SHARD_ADDRESS=os.getenv("MATCH_SHARD_ADDRESS", "127.0.0.1:6010"),
+        MATCH_ETA_SOURCE=os.getenv("MATCH_ETA_SOURCE", "osrm"),  # "graph": shard workers route on the road graph
+        MATCH_ROAD_GRAPH_PATH=os.getenv("MATCH_ROAD_GRAPH_PATH"),  # Graph.save file used with MATCH_ETA_SOURCE=graph
+        MATCH_SHARD_LON_RANGE=os.getenv("MATCH_SHARD_LON_RANGE"),  # "west,east" strips; default: driver positions
+        MATCH_SHARD_AUTHKEY=os.getenv("MATCH_SHARD_AUTHKEY"),  # Required with MATCH_SHARDS, see sharding.service_authkey
+        MATCH_SHARD_ALLOW_REMOTE=os.getenv("MATCH_SHARD_ALLOW_REMOTE", "False") == "True",  # Non-loopback address
+        MATCH_SHARD_TIMEOUT=float(os.getenv("MATCH_SHARD_TIMEOUT", "10")),  # Slower matches fall back in-process
+        MATCH_SHARD_REFRESH=float(os.getenv("MATCH_SHARD_REFRESH", "5")),  # Seconds between driver reloads
+        MATCH_RATING_FIELD=os.getenv("MATCH_RATING_FIELD", "rating"),  # "rating" (lifetime) or "recent_rating" (decayed)
+        RATING_AGGREGATION_INTERVAL=float(os.getenv("RATING_AGGREGATION_INTERVAL", "0")),  # 0 = no in-process thread
+        RATING_AGGREGATOR_PROCESS=os.getenv("RATING_AGGREGATOR_PROCESS", "True") == "True",  # gunicorn starts one per host
+        RATING_BATCH_SIZE=int(os.getenv("RATING_BATCH_SIZE", "500")),
+        RATING_HALF_LIFE_DAYS=float(os.getenv("RATING_HALF_LIFE_DAYS", "30")),
+        RATING_GAP_SECONDS=float(os.getenv("RATING_GAP_SECONDS", "300")),  # Wait for uncommitted rating ids
     )
     
     # Initialize database
     db.init_app(app)
     
-    # Initialize Flask-Migrate
-    Migrate(app, db)
+    # Initialize Flask-Migrate (imported lazily, it is only needed for `flask db` commands)
+    if migrations:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Initialize latency instrumentation (/metrics, X-Timing header)
+    metrics.init_app(app)
+
+    # Load the precomputed ETA matrix if one is configured (requires NumPy)
+    if app.config["ETA_MATRIX_PATH"]:
+        from eta_matrix import EtaMatrixStore
+        app.extensions["eta_matrix"] = EtaMatrixStore(app.config["ETA_MATRIX_PATH"])
 
     # Register Blueprints
     app.register_blueprint(routes)
+
+    # Aggregate submitted ratings in the background (or run `python rating_aggregator.py` separately)
+    if app.config["RATING_AGGREGATION_INTERVAL"] > 0:
+        from rating_aggregator import start_aggregator
+        start_aggregator(app)
     
     return app
 
 if __name__ == "__main__":
+    from rating_aggregator import start_aggregator, DEFAULT_INTERVAL
     app = create_app()
+    start_aggregator(app, interval=app.config["RATING_AGGREGATION_INTERVAL"] or DEFAULT_INTERVAL)
+    # One shard service per host; the debug reloader's child process reuses the parent's.
+    if app.config["MATCH_SHARDS"] and os.getenv("WERKZEUG_RUN_MAIN") != "true":
+        import atexit
+        import sharding
+        sharding.get_service(app)  # Refuses a missing MATCH_SHARD_AUTHKEY or a remote address
+        atexit.register(sharding.spawn_service().terminate)
     app.run(debug=os.getenv("FLASK_DEBUG", "True") == "True", host="0.0.0.0", port=5000)
@@ -0,0 +1,125 @@
+# benchmarks/bench_sharding.py
+"""
+Throughput scaling benchmark for region-sharded matching.
+
+Loads synthetic drivers into a ShardedMatcher for each requested shard count and runs the same
+set of match requests against it. Shard count 0 is the unsharded baseline: one RideMatcher shared
+by the request threads, as /match does without MATCH_SHARDS.
+
+With --eta-source graph, ETAs come from A* on a synthetic road graph held by every worker, so
+matching is CPU-bound and the requests per second show how work spreads across cores. With
+--eta-source osrm, ETAs come from a local OSRM stub with artificial latency, so matching is
+I/O-bound and the numbers show whether concurrent matches still wait on OSRM in parallel.
+
+Usage:
+    python -m benchmarks.bench_sharding --shards 1,2,4 --drivers 2000 --requests 400
+    python -m benchmarks.bench_sharding --eta-source osrm --shards 0,1,2 --osrm-latency-ms 50
+"""
+
+import argparse
+import json
+import os
+from contextlib import ExitStack
+
+import traffic
+from benchmarks.osrm_stub import OSRMStub
+from benchmarks.stats import run_load
+from benchmarks.synthetic import build_grid_graph, generate_drivers, generate_users
+from matcher import RideMatcher
+from models import COMPATIBLE_PROFILES, encode_preferences
+from sharding import DriverRecord, ShardMap, ShardedMatcher
+
+
+def build_records(drivers):
+    return [
+        DriverRecord(i + 1, d["latitude"], d["longitude"], 5.0, encode_preferences(d["smoking"], d["music"], d["pets"]))
+        for i, d in enumerate(drivers) if d["is_available"]
+    ]
+
+
+class InProcessMatcher:
+    """Unsharded baseline with the same interface as ShardedMatcher."""
+
+    def __init__(self, records, top_k):
+        self.matcher = RideMatcher(top_k=top_k)
+        self.records = records
+
+    def match(self, user_location, user_profile):
+        compatible = COMPATIBLE_PROFILES[user_profile]
+        candidates = self.matcher.rank_candidates(
+            user_location, [r for r in self.records if r.preference_profile in compatible])
+        driver, _ = self.matcher.pick_best(user_location, candidates)
+        return (driver.id if driver else None), self.matcher.last_match_stats
+
+
+def run(shard_counts, driver_count, request_count, grid, top_k, seed, eta_source="graph",
+        osrm_latency_ms=50.0, concurrency=None):
+    drivers = build_records(generate_drivers(driver_count, seed))
+    users = generate_users(request_count, seed)
+    graph, _ = build_grid_graph(grid, grid, seed, spacing_km=20.0 / grid) if eta_source == "graph" else (None, None)
+
+    results = {}
+    with ExitStack() as stack:
+        if eta_source == "osrm":
+            stub = stack.enter_context(OSRMStub(latency_ms=osrm_latency_ms, seed=seed))
+            # Forked shard workers inherit the module setting.
+            traffic.OSRM_BASE_URL = stub.base_url
+        for shard_count in shard_counts:
+            if shard_count == 0:
+                service = InProcessMatcher(drivers, top_k)
+            else:
+                shard_map = ShardMap.from_points([(d.latitude, d.longitude) for d in drivers], shard_count)
+                service = ShardedMatcher(shard_map, road_graph=graph, eta_source=eta_source, top_k=top_k).start()
+                service.load(drivers)
+
+            def match(i):
+                user = users[i]
+                profile = encode_preferences(user["smoking"], user["music"], user["pets"])
+                driver_id, _ = service.match((user["latitude"], user["longitude"]), profile)
+                return driver_id is not None
+
+            try:
+                # By default concurrency scales with shards so every worker has requests queued.
+                results[shard_count] = run_load(match, request_count, concurrency or 4 * max(shard_count, 1))
+            finally:
+                if shard_count:
+                    service.stop()
+
+    baseline = results[shard_counts[0]]["requests_per_second"]
+    for shard_count, summary in results.items():
+        summary["speedup"] = round(summary["requests_per_second"] / baseline, 2) if baseline else None
+    return {
+        "config": {"shards": shard_counts, "drivers": driver_count, "requests": request_count,
+                   "grid": grid, "top_k": top_k, "seed": seed, "eta_source": eta_source,
+                   "osrm_latency_ms": osrm_latency_ms if eta_source == "osrm" else None,
+                   "concurrency": concurrency, "cpu_count": os.cpu_count()},
+        "results": {str(shard_count): summary for shard_count, summary in results.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded matching throughput benchmark.")
+    parser.add_argument("--shards", default="1,2,4", help="Comma-separated shard counts (0 = unsharded baseline)")
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--grid", type=int, default=40, help="Side length of the synthetic road grid")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--eta-source", choices=("graph", "osrm"), default="graph")
+    parser.add_argument("--osrm-latency-ms", type=float, default=50.0, help="OSRM stub latency (osrm mode)")
+    parser.add_argument("--concurrency", type=int, help="Client threads (default: 4 per shard)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    shard_counts = [int(n) for n in args.shards.split(",")]
+    report = json.dumps(run(shard_counts, args.drivers, args.requests, args.grid, args.top_k, args.seed,
+                            args.eta_source, args.osrm_latency_ms, args.concurrency), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_startup.py
+"""
+Worker cold start benchmark: a fresh interpreter vs a worker forked from the preloaded app.
+
+"cold" starts a new Python process that imports and builds the app and serves one request, as a
+non-preloaded worker does. "forked" preloads wsgi.py once and then forks workers that only run
+the post-fork hook before serving their first request. Both report the time until the first
+response and the first request's own duration, in milliseconds.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stats import summarize
+
+FIRST_REQUEST_PATH = "/users"
+
+COLD_WORKER = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+ready = time.perf_counter()
+response = app.test_client().get({path!r})
+done = time.perf_counter()
+print(json.dumps({{"ready": ready - started, "first_response": done - started,
+                   "first_request": done - ready, "status": response.status_code}}))
+"""
+
+
+def run_cold(runs):
+    samples = []
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_WORKER.format(path=FIRST_REQUEST_PATH)],
+            cwd=root, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def run_forked(runs):
+    import wsgi
+
+    with wsgi.app.app_context():
+        wsgi.db.create_all()
+
+    samples = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            started = time.perf_counter()
+            wsgi.after_fork(wsgi.app)
+            ready = time.perf_counter()
+            response = wsgi.app.test_client().get(FIRST_REQUEST_PATH)
+            done = time.perf_counter()
+            result = {"ready": ready - forked, "first_response": done - forked,
+                      "first_request": done - ready, "fork": started - forked, "status": response.status_code}
+            os.write(write_fd, json.dumps(result).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            samples.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+    return samples, wsgi.PRELOAD_SECONDS
+
+
+def report(samples):
+    summaries = {}
+    for key in ("ready", "first_response", "first_request"):
+        summary = summarize([s[key] for s in samples], wall_seconds=0)
+        summaries[key] = {k: v for k, v in summary.items() if k.endswith("_ms")}
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker cold start and first-request latency benchmark.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ride-startup-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+
+    # The forked run creates the schema the cold workers' first request reads from.
+    forked, preload_seconds = run_forked(args.runs)
+    cold = run_cold(args.runs)
+    result = {
+        "config": {"runs": args.runs, "first_request_path": FIRST_REQUEST_PATH},
+        "preload_ms": round(preload_seconds * 1000.0, 3),
+        "cold": report(cold),
+        "forked": report(forked),
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_traffic_profiles.py
+"""
+Memory and query-time benchmark for time-dependent traffic profiles in graphs.Graph.
+
+Builds a synthetic grid city, gives its edges rush-hour speed profiles, and compares static A*
+with time-dependent A* for the same origin/destination pairs at several departure times.
+
+Usage:
+    python -m benchmarks.bench_traffic_profiles --grid 100 --queries 200
+"""
+
+import argparse
+import json
+import random
+import time
+
+from benchmarks.stats import summarize
+from benchmarks.synthetic import assign_speed_profiles, build_grid_graph
+
+DEPARTURES = {"03:00": 3 * 60, "08:00": 8 * 60, "12:00": 12 * 60, "17:30": 17 * 60 + 30}
+
+
+def time_queries(graph, pairs, departure_time=None):
+    latencies, results = [], []
+    started = time.perf_counter()
+    for start, end in pairs:
+        t0 = time.perf_counter()
+        results.append(graph.a_star(start, end, departure_time=departure_time))
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started), results
+
+
+def run(grid, queries, seed):
+    graph, nodes = build_grid_graph(grid, grid, seed)
+    edge_count = sum(len(edges) for edges in graph.graph.values()) // 2
+    profiled = assign_speed_profiles(graph, seed)
+    memory = graph.profile_memory_bytes()
+
+    rng = random.Random(f"profile-queries-{seed}")
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(queries)]
+
+    static_summary, static_results = time_queries(graph, pairs)
+    results = {"static": static_summary}
+    for label, minute in DEPARTURES.items():
+        summary, td_results = time_queries(graph, pairs, departure_time=minute)
+        changed = sum(1 for (p1, _), (p2, _) in zip(static_results, td_results) if p1 != p2)
+        mean_cost = sum(cost for _, cost in td_results) / len(td_results)
+        summary["routes_changed"] = changed
+        summary["mean_travel_minutes"] = round(mean_cost, 2)
+        results[f"departure_{label}"] = summary
+
+    return {
+        "config": {"grid": grid, "queries": queries, "seed": seed},
+        "graph": {
+            "nodes": len(nodes),
+            "edges": edge_count,
+            "profiled_edges": profiled,
+            "profile_memory_bytes": memory,
+            "bytes_per_profiled_edge": round(memory / profiled, 1) if profiled else None,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time-dependent traffic profile benchmark.")
+    parser.add_argument("--grid", type=int, default=100, help="Side length of the synthetic road grid")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = json.dumps(run(args.grid, args.queries, args.seed), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/osrm_stub.py
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import polyline
+
+from graphs import Graph
+
+ROAD_FACTOR = 1.3       # Road distance relative to straight-line distance
+STUB_SPEED_KMH = 30.0   # Average driving speed used to derive durations
+
+
+class OSRMStub:
+    """
+    Minimal local stand-in for the OSRM HTTP API.
+    Serves /route/v1/driving/... with durations derived from the Haversine distance and an
+    artificial per-request latency, so benchmarks do not depend on the public OSRM server.
+    """
+
+    def __init__(self, latency_ms=20.0, jitter_ms=5.0, points_per_km=20, host="127.0.0.1", port=0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.points_per_km = points_per_km
+        self.request_count = 0
+        self._rng = random.Random(f"osrm-stub-{seed}")
+        self._lock = threading.Lock()
+        self._graph = Graph()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _delay(self):
+        with self._lock:
+            self.request_count += 1
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000.0)
+
+    def route(self, coords):
+        """Builds an OSRM-shaped route response for a list of (lat, lon) waypoints."""
+        distance_km = 0.0
+        geometry = [coords[0]]
+        for start, end in zip(coords, coords[1:]):
+            leg_km = self._graph.heuristic(start, end) * ROAD_FACTOR
+            distance_km += leg_km
+            steps = max(1, int(leg_km * self.points_per_km))
+            for i in range(1, steps + 1):
+                t = i / steps
+                geometry.append((start[0] + (end[0] - start[0]) * t, start[1] + (end[1] - start[1]) * t))
+        return {
+            "code": "Ok",
+            "routes": [{
+                "distance": distance_km * 1000.0,
+                "duration": distance_km / STUB_SPEED_KMH * 3600.0,
+                "geometry": polyline.encode(geometry),
+            }],
+        }
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path  # urlparse would strip ";lon,lat" as URL params
+                parts = path.strip("/").split("/")
+                if len(parts) != 4 or parts[0] != "route":
+                    self._send(404, {"code": "InvalidUrl", "message": f"Unsupported path {path}"})
+                    return
+                try:
+                    # OSRM coordinates are lon,lat pairs separated by ';'.
+                    coords = [(float(lat), float(lon)) for lon, lat in (p.split(",") for p in parts[3].split(";"))]
+                except ValueError:
+                    self._send(400, {"code": "InvalidQuery", "message": "Malformed coordinates"})
+                    return
+                stub._delay()
+                self._send(200, stub.route(coords))
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+        return Handler
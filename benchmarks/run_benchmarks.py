@@ -0,0 +1,223 @@
+# benchmarks/run_benchmarks.py
+"""
+Load-test and benchmark suite for the ride matching service.
+
+Seeds a throwaway SQLite database with synthetic users, drivers and ratings, starts a local
+OSRM stub with configurable latency, serves the Flask app on a local port and drives
+/match, /api/route (full, encoded and simplified geometry), /rate_driver and Graph.a_star
+concurrently. Results are written as JSON.
+
+Usage:
+    python -m benchmarks.run_benchmarks --scale small --output bench_output.txt
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+import navigation
+import traffic
+from app import create_app
+from benchmarks.osrm_stub import OSRMStub
+from benchmarks.stats import run_load
+from benchmarks.synthetic import (
+    build_grid_graph, generate_drivers, generate_ratings, generate_users,
+)
+from models import db, User, Driver, Rating, encode_preferences
+from rating_aggregator import RatingAggregator
+
+SCALES = {
+    "small": {"users": 200, "drivers": 50, "ratings_per_driver": 5, "grid": 30, "requests": 200, "concurrency": 8},
+    "medium": {"users": 2000, "drivers": 500, "ratings_per_driver": 10, "grid": 80, "requests": 1000, "concurrency": 16},
+    "large": {"users": 20000, "drivers": 2000, "ratings_per_driver": 20, "grid": 150, "requests": 5000, "concurrency": 32},
+}
+
+SCENARIOS = ("match", "route", "route_polyline", "route_simplified", "rate_driver", "a_star")
+
+
+def seed_database(app, users, drivers, ratings):
+    """Bulk-inserts the synthetic rows and aggregates the ratings into the driver averages."""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.bulk_insert_mappings(User, users)
+        # Bulk inserts skip mapper events, so derive the preference profile here.
+        db.session.bulk_insert_mappings(Driver, [
+            dict(d, preference_profile=encode_preferences(d["smoking"], d["music"], d["pets"])) for d in drivers
+        ])
+        db.session.bulk_insert_mappings(Rating, ratings)
+        db.session.commit()
+        RatingAggregator(settle_seconds=0).drain()
+
+
+class LocalServer:
+    """Serves a WSGI app on a background thread so requests go through a real HTTP stack."""
+
+    def __init__(self, app, host="127.0.0.1"):
+        self._server = make_server(host, 0, app, threaded=True)
+        self.base_url = f"http://{host}:{self._server.port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        return False
+
+
+_sessions = threading.local()
+
+
+def _session():
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+
+def build_scenarios(base_url, users, drivers, nodes, graph, seed, response_sizes):
+    """
+    Returns a dict mapping scenario name to a task callable taking the request index.
+    Route scenarios append their response body sizes to response_sizes[name].
+    """
+    rng = random.Random(f"scenarios-{seed}")
+    user_ids = [rng.randint(1, len(users)) for _ in range(len(users))]
+    points = [(u["latitude"], u["longitude"]) for u in users]
+
+    def pick(seq, i, offset=0):
+        return seq[(i * 7919 + offset) % len(seq)]
+
+    def match(i):
+        response = _session().get(f"{base_url}/match/{pick(user_ids, i)}")
+        return response.status_code in (200, 404)
+
+    def route_task(name, **options):
+        def route(i):
+            driver = pick(drivers, i)
+            payload = dict(
+                options,
+                driver_location=[driver["latitude"], driver["longitude"]],
+                passenger_pickup=list(pick(points, i)),
+                passenger_dropoff=list(pick(points, i, offset=1)),
+            )
+            response = _session().post(f"{base_url}/api/route", json=payload)
+            response_sizes.setdefault(name, []).append(len(response.content))
+            return response.status_code == 200
+        return route
+
+    def rate_driver(i):
+        payload = {"user_id": pick(user_ids, i), "rating": 1 + (i % 5)}
+        response = _session().post(f"{base_url}/rate_driver/{1 + (i % len(drivers))}", json=payload)
+        return response.status_code == 202
+
+    def a_star(i):
+        path, _ = graph.a_star(pick(nodes, i), pick(nodes, i, offset=1))
+        return path is not None
+
+    return {
+        "match": match,
+        "route": route_task("route"),
+        "route_polyline": route_task("route_polyline", geometry_format="polyline"),
+        "route_simplified": route_task("route_simplified", geometry_format="polyline", zoom=14),
+        "rate_driver": rate_driver,
+        "a_star": a_star,
+    }
+
+
+def run(config):
+    """
+    Runs the selected scenarios for one configuration and returns the JSON-serializable report.
+    :param config: Dict with the keys of a SCALES entry plus seed, osrm_latency_ms and scenarios.
+    """
+    seed = config["seed"]
+    users = generate_users(config["users"], seed)
+    drivers = generate_drivers(config["drivers"], seed)
+    ratings = generate_ratings(config["users"], config["drivers"], config["ratings_per_driver"], seed)
+    graph, nodes = build_grid_graph(config["grid"], config["grid"], seed)
+
+    workdir = tempfile.mkdtemp(prefix="ride-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    app = create_app()
+    seed_database(app, users, drivers, ratings)
+
+    results = {}
+    response_sizes = {}
+    with OSRMStub(latency_ms=config["osrm_latency_ms"], seed=seed) as stub:
+        traffic.OSRM_BASE_URL = stub.base_url
+        navigation.OSRM_BASE_URL = stub.base_url
+        with LocalServer(app) as server:
+            scenarios = build_scenarios(server.base_url, users, drivers, nodes, graph, seed, response_sizes)
+            for name in config["scenarios"]:
+                calls_before = stub.request_count
+                results[name] = run_load(scenarios[name], config["requests"], config["concurrency"])
+                results[name]["osrm_calls"] = stub.request_count - calls_before
+                if name == "rate_driver":
+                    # Time the background work the endpoint no longer does inline.
+                    with app.app_context():
+                        started = time.perf_counter()
+                        results[name]["aggregated"] = RatingAggregator(settle_seconds=0).drain()
+                        results[name]["aggregation_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+                if response_sizes.get(name):
+                    results[name]["mean_response_bytes"] = round(sum(response_sizes[name]) / len(response_sizes[name]))
+
+    return {
+        "config": config,
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ride matching load test and benchmark suite.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--drivers", type=int)
+    parser.add_argument("--ratings-per-driver", type=int)
+    parser.add_argument("--grid", type=int, help="Side length of the synthetic road grid")
+    parser.add_argument("--requests", type=int, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--osrm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = dict(SCALES[args.scale], scale=args.scale, seed=args.seed, osrm_latency_ms=args.osrm_latency_ms)
+    for key in ("users", "drivers", "ratings_per_driver", "grid", "requests", "concurrency"):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    config["scenarios"] = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(config["scenarios"]) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = json.dumps(run(config), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/stats.py
+
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, pct):
+    """
+    Returns the pct-th percentile of values using the nearest-rank method.
+    :param values: Sorted list of numbers.
+    :param pct: Percentile between 0 and 100.
+    """
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(latencies, wall_seconds, errors=0):
+    """
+    Summarizes per-request latencies (in seconds) into the benchmark report format.
+    Latency percentiles are reported in milliseconds.
+    """
+    ordered = sorted(latencies)
+    completed = len(ordered)
+
+    def ms(value):
+        return round(value * 1000.0, 3) if value is not None else None
+
+    return {
+        "requests": completed + errors,
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 4),
+        "requests_per_second": round(completed / wall_seconds, 2) if wall_seconds > 0 else None,
+        "mean_ms": ms(sum(ordered) / completed) if completed else None,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else None,
+    }
+
+
+def run_load(task, total, concurrency):
+    """
+    Calls task(i) for i in range(total) across a thread pool and times every call.
+    A call counts as an error if it raises or returns False.
+    :return: Summary dict as produced by summarize().
+    """
+    def timed_call(i):
+        start = time.perf_counter()
+        try:
+            ok = task(i) is not False
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed_call, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for ok, elapsed in outcomes if ok]
+    errors = sum(1 for ok, _ in outcomes if not ok)
+    return summarize(latencies, wall, errors)
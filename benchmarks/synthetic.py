@@ -0,0 +1,149 @@
+# benchmarks/synthetic.py
+
+import math
+import random
+
+from graphs import Graph, SLOT_MINUTES, SLOTS_PER_DAY
+
+# Default synthetic city: a box around central Berlin.
+CITY_CENTER = (52.52, 13.405)
+CITY_RADIUS_KM = 10.0
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+def _km_per_degree_lon(lat):
+    return KM_PER_DEGREE_LAT * math.cos(math.radians(lat))
+
+
+def random_point(rng, center=CITY_CENTER, radius_km=CITY_RADIUS_KM):
+    """Returns a (lat, lon) drawn uniformly from the square of half-width radius_km around center."""
+    lat0, lon0 = center
+    dlat = rng.uniform(-radius_km, radius_km) / KM_PER_DEGREE_LAT
+    dlon = rng.uniform(-radius_km, radius_km) / _km_per_degree_lon(lat0)
+    return (round(lat0 + dlat, 6), round(lon0 + dlon, 6))
+
+
+def generate_users(count, seed=0, center=CITY_CENTER, radius_km=CITY_RADIUS_KM):
+    """
+    Generates synthetic passengers as dicts accepted by the User model.
+    :param count: Number of users to generate.
+    :param seed: Seed for reproducible output.
+    """
+    rng = random.Random(f"users-{seed}")
+    users = []
+    for i in range(count):
+        lat, lon = random_point(rng, center, radius_km)
+        users.append({
+            "name": f"user-{i}",
+            "latitude": lat,
+            "longitude": lon,
+            "smoking": rng.random() < 0.2,
+            "music": rng.random() < 0.6,
+            "pets": rng.random() < 0.3,
+        })
+    return users
+
+
+def generate_drivers(count, seed=0, center=CITY_CENTER, radius_km=CITY_RADIUS_KM, available_ratio=0.8):
+    """
+    Generates synthetic drivers as dicts accepted by the Driver model.
+    :param available_ratio: Fraction of drivers marked as available.
+    """
+    rng = random.Random(f"drivers-{seed}")
+    drivers = []
+    for i in range(count):
+        lat, lon = random_point(rng, center, radius_km)
+        drivers.append({
+            "name": f"driver-{i}",
+            "latitude": lat,
+            "longitude": lon,
+            "is_available": rng.random() < available_ratio,
+            "smoking": rng.random() < 0.2,
+            "music": rng.random() < 0.6,
+            "pets": rng.random() < 0.3,
+        })
+    return drivers
+
+
+def generate_ratings(user_count, driver_count, ratings_per_driver, seed=0):
+    """
+    Generates synthetic ratings as dicts with 1-based user_id/driver_id, matching insertion order.
+    Scores are skewed towards the top of the 1-5 range like real rating data.
+    """
+    rng = random.Random(f"ratings-{seed}")
+    ratings = []
+    if user_count == 0:
+        return ratings
+    for driver_id in range(1, driver_count + 1):
+        for _ in range(ratings_per_driver):
+            ratings.append({
+                "user_id": rng.randint(1, user_count),
+                "driver_id": driver_id,
+                "score": float(min(5, max(1, round(rng.gauss(4.3, 0.8))))),
+            })
+    return ratings
+
+
+def build_grid_graph(rows, cols, seed=0, center=CITY_CENTER, spacing_km=0.25, diagonal_ratio=0.1):
+    """
+    Builds a road-like grid Graph with jittered travel times.
+    Nodes are (lat, lon) tuples laid out on a rows x cols grid around center; each edge weight is
+    its length in km scaled by a random congestion factor, and a fraction of cells get a diagonal.
+    :return: Tuple (graph, nodes) where nodes is the row-major list of grid points.
+    """
+    rng = random.Random(f"graph-{seed}")
+    lat0, lon0 = center
+    dlat = spacing_km / KM_PER_DEGREE_LAT
+    dlon = spacing_km / _km_per_degree_lon(lat0)
+    top = lat0 - dlat * (rows - 1) / 2
+    left = lon0 - dlon * (cols - 1) / 2
+
+    nodes = [(round(top + r * dlat, 6), round(left + c * dlon, 6)) for r in range(rows) for c in range(cols)]
+    graph = Graph()
+    for r in range(rows):
+        for c in range(cols):
+            node = nodes[r * cols + c]
+            if c + 1 < cols:
+                graph.add_edge(node, nodes[r * cols + c + 1], spacing_km * rng.uniform(1.0, 2.0))
+            if r + 1 < rows:
+                graph.add_edge(node, nodes[(r + 1) * cols + c], spacing_km * rng.uniform(1.0, 2.0))
+            if r + 1 < rows and c + 1 < cols and rng.random() < diagonal_ratio:
+                graph.add_edge(node, nodes[(r + 1) * cols + c + 1], spacing_km * math.sqrt(2) * rng.uniform(1.0, 2.0))
+    return graph, nodes
+
+
+def rush_hour_profile(rng, morning_depth=0.5, evening_depth=0.6):
+    """
+    Builds one time-of-day speed profile with morning (07:00-09:30) and evening (16:00-19:00) dips.
+    Dip depth and the off-peak speed vary per call to mimic different road types.
+    """
+    morning = rng.uniform(0.5, 1.0) * morning_depth
+    evening = rng.uniform(0.5, 1.0) * evening_depth
+    off_peak = rng.uniform(0.9, 1.0)
+    profile = []
+    for slot in range(SLOTS_PER_DAY):
+        hour = slot * SLOT_MINUTES / 60.0
+        factor = off_peak
+        if 7.0 <= hour < 9.5:
+            factor -= morning * math.sin(math.pi * (hour - 7.0) / 2.5)
+        elif 16.0 <= hour < 19.0:
+            factor -= evening * math.sin(math.pi * (hour - 16.0) / 3.0)
+        profile.append(max(0.1, factor))
+    return profile
+
+
+def assign_speed_profiles(graph, seed=0, share=1.0):
+    """
+    Gives a random fraction (share) of the graph's edges a rush-hour speed profile.
+    Both directions of an edge share one profile.
+    :return: Number of edges that received a profile.
+    """
+    rng = random.Random(f"profiles-{seed}")
+    assigned = 0
+    for node, edges in graph.graph.items():
+        for neighbor, _ in edges:
+            if node < neighbor and rng.random() < share:
+                graph.set_speed_profile(node, neighbor, rush_hour_profile(rng))
+                assigned += 1
+    return assigned
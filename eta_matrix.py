@@ -0,0 +1,260 @@
+# eta_matrix.py
+
+import argparse
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+
+import traffic
+
+KM_PER_DEGREE_LAT = 111.32
+OSRM_TABLE_CHUNK = 50  # Sources/destinations per OSRM table request (public server caps at 100 coords)
+
+
+class ZoneGrid:
+    """
+    Splits a bounding box into square zones of roughly cell_km x cell_km.
+    Zones are numbered row-major from the south-west corner.
+    """
+
+    def __init__(self, south, west, north, east, cell_km=1.0):
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.cell_km = cell_km
+        self.dlat = cell_km / KM_PER_DEGREE_LAT
+        self.dlon = cell_km / (KM_PER_DEGREE_LAT * math.cos(math.radians((south + north) / 2)))
+        self.rows = max(1, math.ceil((north - south) / self.dlat))
+        self.cols = max(1, math.ceil((east - west) / self.dlon))
+
+    @property
+    def size(self):
+        return self.rows * self.cols
+
+    def zone_of(self, point):
+        """Returns the zone index containing point (lat, lon), or None if it is outside the grid."""
+        lat, lon = point
+        if not (self.south <= lat <= self.north and self.west <= lon <= self.east):
+            return None
+        row = min(int((lat - self.south) / self.dlat), self.rows - 1)
+        col = min(int((lon - self.west) / self.dlon), self.cols - 1)
+        return row * self.cols + col
+
+    def center(self, zone):
+        """Returns the (lat, lon) center of a zone."""
+        row, col = divmod(zone, self.cols)
+        return (self.south + (row + 0.5) * self.dlat, self.west + (col + 0.5) * self.dlon)
+
+    def centers(self):
+        return [self.center(zone) for zone in range(self.size)]
+
+    def to_dict(self):
+        return {"south": self.south, "west": self.west, "north": self.north, "east": self.east, "cell_km": self.cell_km}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["south"], data["west"], data["north"], data["east"], data["cell_km"])
+
+
+class EtaMatrix:
+    """
+    Zone-to-zone travel times in minutes, stored as a float32 NumPy array.
+    Unknown or unreachable pairs are NaN. Saved as a versioned `<path>.<version>.npy` array plus a
+    `<path>.json` manifest naming that array and holding the zone grid, and loaded memory-mapped so
+    lookups never read the whole file.
+    """
+
+    def __init__(self, grid, minutes, source="unknown", built_at=None):
+        self.grid = grid
+        self.minutes = minutes
+        self.source = source
+        self.built_at = built_at if built_at is not None else time.time()
+
+    def lookup(self, start, end):
+        """
+        Returns the rough travel time in minutes between the zones of start and end.
+        :return: Minutes as a float, or None if either point is outside the grid or the pair is unknown.
+        """
+        origin = self.grid.zone_of(start)
+        destination = self.grid.zone_of(end)
+        if origin is None or destination is None:
+            return None
+        value = float(self.minutes[origin, destination])
+        return None if math.isnan(value) else value
+
+    def save(self, path):
+        """
+        Writes the matrix under a new version and then atomically replaces the manifest, so a
+        concurrent load always pairs a grid with the array it was built with.
+        Array versions no longer referenced by the manifest are removed (open memory maps stay valid).
+        """
+        version = f"{time.time_ns():x}"
+        array_name = f"{os.path.basename(path)}.{version}.npy"
+        array_path = os.path.join(os.path.dirname(path), array_name)
+        with open(f"{array_path}.tmp", "wb") as f:
+            np.save(f, self.minutes.astype(np.float32, copy=False))
+        os.replace(f"{array_path}.tmp", array_path)
+
+        manifest = {"array": array_name, "grid": self.grid.to_dict(), "source": self.source, "built_at": self.built_at}
+        with open(f"{path}.json.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+        for stale in glob.glob(f"{glob.escape(path)}.*.npy"):
+            if os.path.basename(stale) != array_name:
+                os.remove(stale)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        grid = ZoneGrid.from_dict(meta["grid"])
+        minutes = np.load(os.path.join(os.path.dirname(path), meta["array"]), mmap_mode="r" if mmap else None)
+        if minutes.shape != (grid.size, grid.size):
+            raise ValueError(f"ETA matrix shape {minutes.shape} does not match a {grid.size}-zone grid")
+        return cls(grid, minutes, meta.get("source", "unknown"), meta.get("built_at"))
+
+
+# ------------------- MATRIX BUILDERS ------------------- #
+
+def build_from_graph(grid, graph):
+    """
+    Builds an EtaMatrix from a local Graph by running one Dijkstra per zone.
+    Each zone is represented by the graph node nearest to its center; edge weights are taken as minutes.
+    """
+    anchors = [graph.nearest_node(center) for center in grid.centers()]
+    minutes = np.full((grid.size, grid.size), np.nan, dtype=np.float32)
+    cache = {}
+    for origin, anchor in enumerate(anchors):
+        if anchor is None:
+            continue
+        if anchor not in cache:
+            cache[anchor] = graph.dijkstra(anchor)
+        dist = cache[anchor]
+        for destination, target in enumerate(anchors):
+            cost = dist.get(target)
+            if cost is not None:
+                minutes[origin, destination] = cost
+    return EtaMatrix(grid, minutes, source="graph")
+
+
+def build_from_osrm(grid, base_url=None, chunk=OSRM_TABLE_CHUNK):
+    """
+    Builds an EtaMatrix from the OSRM table service using zone centers.
+    Requests are split into chunk x chunk blocks; failed blocks are left as NaN.
+    """
+    base_url = base_url or traffic.OSRM_BASE_URL
+    centers = grid.centers()
+    minutes = np.full((grid.size, grid.size), np.nan, dtype=np.float32)
+
+    for src_start in range(0, grid.size, chunk):
+        sources = centers[src_start:src_start + chunk]
+        for dst_start in range(0, grid.size, chunk):
+            destinations = centers[dst_start:dst_start + chunk]
+            # OSRM API expects coordinates in lon,lat order.
+            coords = ";".join(f"{lon},{lat}" for lat, lon in sources + destinations)
+            params = {
+                "sources": ";".join(str(i) for i in range(len(sources))),
+                "destinations": ";".join(str(len(sources) + i) for i in range(len(destinations))),
+                "annotations": "duration",
+            }
+            try:
+                response = requests.get(f"{base_url}/table/v1/driving/{coords}", params=params)
+                data = response.json()
+            except Exception as e:
+                print("Error fetching OSRM table:", e)
+                continue
+            if data.get("code") != "Ok":
+                print("OSRM table request failed:", data.get("message"))
+                continue
+            block = np.array(data["durations"], dtype=np.float64)  # None becomes NaN
+            minutes[src_start:src_start + len(sources), dst_start:dst_start + len(destinations)] = block / 60.0
+    return EtaMatrix(grid, minutes, source="osrm")
+
+
+# ------------------- LOADING & REFRESH ------------------- #
+
+class EtaMatrixStore:
+    """
+    Serves the latest EtaMatrix saved at path.
+    get() re-opens the matrix when the modification time of its manifest changes, at most every check_interval seconds,
+    so a separate refresh job can replace the matrix without restarting the app.
+    """
+
+    def __init__(self, path, check_interval=30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._matrix = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._matrix is not None and now - self._checked_at < self.check_interval:
+            return self._matrix
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(f"{self.path}.json").st_mtime
+            except OSError:
+                return self._matrix
+            if mtime != self._mtime:
+                try:
+                    self._matrix = EtaMatrix.load(self.path)
+                    self._mtime = mtime
+                except (OSError, ValueError) as e:
+                    print("Error loading ETA matrix:", e)
+        return self._matrix
+
+
+class EtaMatrixRefresher(threading.Thread):
+    """Background thread rebuilding the matrix with build() and saving it to path every interval seconds."""
+
+    def __init__(self, build, path, interval=900.0):
+        super().__init__(daemon=True)
+        self.build = build
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def refresh(self):
+        matrix = self.build()
+        matrix.save(self.path)
+        return matrix
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Error refreshing ETA matrix:", e)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the zone-to-zone ETA matrix from OSRM.")
+    parser.add_argument("--bbox", required=True, help="south,west,north,east")
+    parser.add_argument("--cell-km", type=float, default=1.0)
+    parser.add_argument("--output", default=os.getenv("ETA_MATRIX_PATH", "eta_matrix.npy"))
+    parser.add_argument("--interval", type=float, help="Keep running and refresh every N seconds")
+    args = parser.parse_args(argv)
+
+    grid = ZoneGrid(*(float(v) for v in args.bbox.split(",")), cell_km=args.cell_km)
+    refresher = EtaMatrixRefresher(lambda: build_from_osrm(grid), args.output, args.interval or 0)
+    if args.interval:
+        refresher.run()
+    else:
+        matrix = refresher.refresh()
+        print(f"Wrote {grid.size}x{grid.size} ETA matrix to {args.output} (source={matrix.source})")
+
+
+if __name__ == "__main__":
+    main()
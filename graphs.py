@@ -1,13 +1,20 @@
+from array import array
 from collections import defaultdict
+from datetime import datetime
 import heapq
+import json
 import math
 
+SLOT_MINUTES = 15                          # Length of one time-of-day slot in a speed profile
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES    # 96 slots per profile
+
 class Graph:
     """Graph to store locations and find shortest routes efficiently using dynamic travel times."""
     
     def __init__(self):
         self.graph = defaultdict(list)
         self.traffic_data = {}  # Stores dynamic travel times (in minutes or km) for each edge
+        self.speed_profiles = {}  # Per-edge time-of-day speed factors, array('f') of SLOTS_PER_DAY values
 
     def add_edge(self, point1, point2, distance, bidirectional=True):
         """
@@ -41,6 +48,71 @@ class Graph:
         """
         return self.traffic_data.get((point1, point2), default_weight)
 
+    def set_speed_profile(self, point1, point2, speed_factors, bidirectional=True):
+        """
+        Sets a time-of-day speed profile for the edge between point1 and point2.
+        :param speed_factors: SLOTS_PER_DAY speed factors relative to the base weight (1.0 = free flow,
+                              0.5 = half speed, so the edge takes twice as long in that slot).
+        :param bidirectional: If True, both directions share the same profile array.
+        """
+        profile = array('f', speed_factors)
+        if len(profile) != SLOTS_PER_DAY:
+            raise ValueError(f"Speed profile must have {SLOTS_PER_DAY} slots, got {len(profile)}")
+        if min(profile) <= 0:
+            raise ValueError("Speed factors must be positive")
+        self.speed_profiles[(point1, point2)] = profile
+        if bidirectional:
+            self.speed_profiles[(point2, point1)] = profile
+
+    def get_edge_weight_at(self, point1, point2, base_weight, minute_of_day):
+        """
+        Retrieves the travel time for the edge when entered at the given time of day.
+        Edges without a speed profile fall back to get_edge_weight.
+        :param minute_of_day: Minutes since midnight; values past 1440 wrap around to the next day.
+        """
+        profile = self.speed_profiles.get((point1, point2))
+        if profile is None:
+            return self.get_edge_weight(point1, point2, base_weight)
+        return base_weight / profile[int(minute_of_day // SLOT_MINUTES) % SLOTS_PER_DAY]
+
+    def profile_memory_bytes(self):
+        """Returns the memory used by the speed profile arrays (shared arrays are counted once)."""
+        unique = {id(profile): profile for profile in self.speed_profiles.values()}
+        return sum(profile.itemsize * len(profile) for profile in unique.values())
+
+    def save(self, path):
+        """
+        Writes the edges, their current travel times and the speed profiles to a JSON file.
+        Profiles shared between edges are stored once and stay shared when loaded.
+        """
+        profiles, profile_index = [], {}
+        for profile in self.speed_profiles.values():
+            if id(profile) not in profile_index:
+                profile_index[id(profile)] = len(profiles)
+                profiles.append(list(profile))
+        data = {
+            "edges": [[node, neighbor, weight] for node, neighbors in self.graph.items() for neighbor, weight in neighbors],
+            "traffic": [[a, b, weight] for (a, b), weight in self.traffic_data.items()],
+            "profiles": profiles,
+            "profile_edges": [[a, b, profile_index[id(profile)]] for (a, b), profile in self.speed_profiles.items()],
+        }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a graph written by save."""
+        with open(path) as f:
+            data = json.load(f)
+        graph = cls()
+        for a, b, weight in data["edges"]:
+            graph.graph[tuple(a)].append((tuple(b), weight))
+        graph.traffic_data = {(tuple(a), tuple(b)): weight for a, b, weight in data["traffic"]}
+        profiles = [array('f', factors) for factors in data["profiles"]]
+        for a, b, index in data["profile_edges"]:
+            graph.speed_profiles[(tuple(a), tuple(b))] = profiles[index]
+        return graph
+
     def heuristic(self, point1, point2):
         """Estimates the distance between two points using the Haversine formula (great-circle distance)."""
         lat1, lon1 = point1
@@ -54,11 +126,17 @@ class Graph:
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
         return R * c  # Estimated distance in km
 
-    def a_star(self, start, end):
+    def a_star(self, start, end, departure_time=None):
         """
         Finds the shortest path from start to end using the A* search algorithm.
         Returns a tuple of (path, total_dynamic_cost).
+        :param departure_time: Optional departure as a datetime or minutes since midnight. When given,
+                               each edge with a speed profile is evaluated at the time it is reached
+                               (time-dependent A*), so edge weights must be travel times in minutes.
         """
+        if isinstance(departure_time, datetime):
+            departure_time = departure_time.hour * 60 + departure_time.minute + departure_time.second / 60
+
         pq = [(0, start)]  # Priority queue: (estimated total cost, current node)
         g_cost = {node: float('inf') for node in self.graph}  # Cost to reach each node from start
         g_cost[start] = 0
@@ -71,8 +149,12 @@ class Graph:
                 return self.reconstruct_path(came_from, end), g_cost[end]
             
             for neighbor, base_weight in self.graph[node]:
-                # Use updated dynamic weight if available, otherwise fall back to the base weight
-                dynamic_weight = self.get_edge_weight(node, neighbor, base_weight)
+                if departure_time is None:
+                    # Use updated dynamic weight if available, otherwise fall back to the base weight
+                    dynamic_weight = self.get_edge_weight(node, neighbor, base_weight)
+                else:
+                    # Evaluate the edge at the time we actually reach it
+                    dynamic_weight = self.get_edge_weight_at(node, neighbor, base_weight, departure_time + g_cost[node])
                 new_cost = g_cost[node] + dynamic_weight
 
                 if new_cost < g_cost[neighbor]:
@@ -83,6 +165,31 @@ class Graph:
 
         return None, float('inf')  # No path found
 
+    def dijkstra(self, start):
+        """
+        Computes the lowest dynamic cost from start to every reachable node.
+        Returns a dict mapping each reachable node to its total cost.
+        """
+        dist = {start: 0}
+        pq = [(0, start)]
+
+        while pq:
+            cost, node = heapq.heappop(pq)
+            if cost > dist[node]:
+                continue  # Stale queue entry
+
+            for neighbor, base_weight in self.graph.get(node, ()):
+                new_cost = cost + self.get_edge_weight(node, neighbor, base_weight)
+                if new_cost < dist.get(neighbor, float('inf')):
+                    dist[neighbor] = new_cost
+                    heapq.heappush(pq, (new_cost, neighbor))
+
+        return dist
+
+    def nearest_node(self, point):
+        """Returns the graph node closest to point by Haversine distance, or None for an empty graph."""
+        return min(self.graph, key=lambda node: self.heuristic(point, node), default=None)
+
     def reconstruct_path(self, came_from, current):
         """Reconstructs the path from start to end using the came_from mapping."""
         path = [current]
@@ -0,0 +1,59 @@
+# gunicorn.conf.py
+# Preload-and-fork server configuration: wsgi.py builds the app once in the master process,
+# then the workers are forked from it. With MATCH_SHARDS set, the master also starts the host's
+# single shard service (sharding.py), which all workers share, and the host's rating aggregator
+# (rating_aggregator.py) unless RATING_AGGREGATOR_PROCESS=False because it runs elsewhere.
+# Metrics are kept per process; the workers write snapshots to METRICS_MULTIPROC_DIR and /metrics
+# sums them (see metrics.py), so every scrape covers all workers.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = True
+
+# Set before the app is preloaded, so the master and every forked worker see the same directory.
+if not os.getenv("METRICS_MULTIPROC_DIR"):
+    os.environ["METRICS_MULTIPROC_DIR"] = metrics_dir = tempfile.mkdtemp(prefix="ride-metrics-")
+else:
+    metrics_dir = None  # Provided by the deployment, which also owns its clean-up
+
+shard_service = None  # Popen of the shard service started in when_ready
+rating_aggregator = None  # Popen of the rating aggregator started in when_ready
+
+
+def when_ready(server):
+    global shard_service, rating_aggregator
+    import wsgi
+    server.log.info("Preloaded app in %.1f ms", wsgi.PRELOAD_SECONDS * 1000)
+    config = wsgi.app.config
+    if config["MATCH_SHARDS"]:
+        import sharding
+        shard_service = sharding.spawn_service()
+        server.log.info("Started shard service (pid %s)", shard_service.pid)
+    # Skipped when RATING_AGGREGATION_INTERVAL already started the in-process thread.
+    if config["RATING_AGGREGATOR_PROCESS"] and "rating_aggregator" not in wsgi.app.extensions:
+        import rating_aggregator as aggregator
+        rating_aggregator = aggregator.spawn_process(config["RATING_AGGREGATION_INTERVAL"] or aggregator.DEFAULT_INTERVAL)
+        server.log.info("Started rating aggregator (pid %s)", rating_aggregator.pid)
+    elif "rating_aggregator" not in wsgi.app.extensions:
+        server.log.warning("No rating aggregator started; driver ratings only change if one runs elsewhere")
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.after_fork(wsgi.app)
+
+
+def on_exit(server):
+    if shard_service is not None:
+        shard_service.terminate()
+    if rating_aggregator is not None:
+        rating_aggregator.terminate()
+    if metrics_dir is not None:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
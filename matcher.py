@@ -1,84 +1,191 @@
 # matcher.py
 
-from models import db, Driver, Rating
+import threading
+
+from models import Driver, COMPATIBLE_PROFILES, encode_preferences
 from graphs import Graph
-from traffic import get_live_travel_time
-from sqlalchemy.sql import func
+from traffic import get_live_travel_time, DEFAULT_TIMEOUT as DEFAULT_OSRM_TIMEOUT
+from metrics import MATCH_OSRM_CALLS, is_enabled, span, timed
+
+DEFAULT_TOP_K = 5
+DEFAULT_MAX_SPEED_KMH = 90.0
+ATTEMPTS_PER_TOP_K = 2  # ETA lookups allowed per match, as a multiple of top_k
 
 class RideMatcher:
     """
     Finds the best available driver for a user based on:
       - Real-time ETA (via OSRM API)
       - Straight-line distance (Haversine estimate)
-      - Driver rating (dynamic, based on user ratings)
+      - Driver rating (lifetime or time-decayed average of user ratings, see rating_aggregator.py)
       - Passenger preferences (smoking, music, pets; at least 2/3 must match)
     
     The composite score is calculated such that lower scores represent better matches.
     """
 
-    def __init__(self):
+    # Define weight factors (adjustable)
+    WEIGHT_ETA = 0.5         # Weight for real-time ETA (in minutes)
+    WEIGHT_DISTANCE = 0.3    # Weight for straight-line distance (in km)
+
+    def __init__(self, eta_matrix=None, top_k=DEFAULT_TOP_K, max_speed_kmh=DEFAULT_MAX_SPEED_KMH, eta_store=None,
+                 rating_field="rating", osrm_timeout=DEFAULT_OSRM_TIMEOUT, max_attempts=None):
+        """
+        :param eta_matrix: Optional precomputed zone-to-zone ETA matrix (see eta_matrix.py), used when OSRM fails.
+        :param eta_store: Optional EtaMatrixStore; takes precedence over eta_matrix so a long-lived
+                          matcher always uses the latest saved matrix.
+        :param top_k: Maximum number of candidates scored with an exact ETA per match; candidates
+                      whose ETA cannot be retrieved do not count towards it.
+        :param max_speed_kmh: Upper bound on average driving speed, used for the ETA lower bound.
+        :param rating_field: Driver attribute scored as the rating, e.g. "recent_rating" for the
+                             time-decayed average; drivers without one fall back to Driver.rating.
+        :param osrm_timeout: Seconds to wait for a live ETA before falling back to the ETA matrix.
+        :param max_attempts: Maximum number of ETA lookups per match, failed ones included, so an
+                             OSRM outage without an ETA matrix cannot cost one timeout per driver.
+                             Defaults to ATTEMPTS_PER_TOP_K * top_k.
+        """
         # Create an instance of Graph for calculating straight-line distances.
         self.graph = Graph()
+        self.eta_matrix = eta_matrix
+        self.top_k = top_k
+        self.max_speed_kmh = max_speed_kmh
+        self.eta_store = eta_store
+        self.rating_field = rating_field
+        self.osrm_timeout = osrm_timeout
+        self.max_attempts = max_attempts if max_attempts is not None else ATTEMPTS_PER_TOP_K * top_k
+        # Per-thread, so one matcher can serve concurrent requests.
+        self._local = threading.local()
+
+    @property
+    def last_match_stats(self):
+        """Counters (candidates, osrm_calls) of the last match made on the current thread."""
+        stats = getattr(self._local, "stats", None)
+        if stats is None:
+            stats = self._local.stats = {"candidates": 0, "osrm_calls": 0}
+        return stats
 
-    def calculate_driver_rating(self, driver_id):
+    @last_match_stats.setter
+    def last_match_stats(self, stats):
+        self._local.stats = stats
+
+    def composite_score(self, eta, distance_km, driver_rating):
         """
-        Dynamically calculates the average rating of a driver.
-        Returns a value between 1 and 5 (defaults to 5.0 if no ratings exist).
+        Computes the composite score (lower is better).
+        Lower ETA and lower distance are better, and a higher rating (between 1 and 5) reduces the score.
         """
-        avg_rating = db.session.query(func.avg(Rating.score)).filter(Rating.driver_id == driver_id).scalar()
-        return round(avg_rating, 2) if avg_rating else 5.0
+        return (self.WEIGHT_ETA * eta + self.WEIGHT_DISTANCE * distance_km) / driver_rating
 
+    def estimate_travel_time(self, start, end):
+        """
+        Returns the live OSRM travel time in minutes, falling back to the precomputed
+        ETA matrix when the OSRM call fails or takes longer than osrm_timeout.
+        Returns None if neither source has a value.
+        """
+        eta = get_live_travel_time(start, end, timeout=self.osrm_timeout)
+        if eta is None:
+            eta_matrix = self.eta_store.get() if self.eta_store is not None else self.eta_matrix
+            if eta_matrix is not None:
+                eta = eta_matrix.lookup(start, end)
+        return eta
+
+    @timed("match.total")
     def find_best_driver(self, user):
         """
         This function finds and then returns the best available driver for the given user.
-        It onnly really considers drivers that match at least 2 out of 3 preferences (smoking, music, pets).
+        It onnly really considers drivers that match at least 2 out of 3 preferences (smoking, music, pets),
+        which is resolved in the database through the drivers' precomputed preference profiles.
         Combines both dynamic ETA and the Haversine distance, then adjusts for driver rating.
+
+        Matching runs in two stages (see rank_candidates and pick_best). Counters for the last
+        call are kept in self.last_match_stats.
         """
-        available_drivers = Driver.query.filter_by(is_available=True).all()
+        self.last_match_stats = {"candidates": 0, "osrm_calls": 0}
+
+        # Only load drivers whose preference profile agrees with the user's on at least 2 of 3
+        # preferences (smoking, music, pets); the (is_available, preference_profile) index serves this.
+        user_profile = encode_preferences(user.smoking, user.music, getattr(user, 'pets', False))
+        with span("match.load_drivers"):
+            available_drivers = Driver.query.filter_by(is_available=True).filter(
+                Driver.preference_profile.in_(COMPATIBLE_PROFILES[user_profile])
+            ).all()
         if not available_drivers:
             return None  # No available drivers
 
-        best_driver = None
-        best_score = float('inf')
         user_location = (user.latitude, user.longitude)
+        candidates = self.rank_candidates(user_location, available_drivers)
+        best_driver, _ = self.pick_best(user_location, candidates)
 
-        # Define weight factors (adjustable)
-        weight_eta = 0.5         # Weight for real-time ETA (in minutes)
-        weight_distance = 0.3    # Weight for straight-line distance (in km)
-        # Higher driver rating is better, so we divide by rating to lower the score
-        # (Assuming ratings are between 1 and 5)
-
-        for driver in available_drivers:
-            driver_location = (driver.latitude, driver.longitude)
-
-            # Check if at least 2 of 3 preferences match:
-            preference_match = sum([
-                user.smoking == driver.smoking,
-                user.music == driver.music,
-                getattr(user, 'pets', False) == getattr(driver, 'pets', False)
-            ])
-            if preference_match < 2:
-                continue
-
-            # Calculate straight-line distance using the Haversine formula from our Graph class.
-            distance_km = self.graph.heuristic(user_location, driver_location)
-
-            # Get dynamic ETA (in minutes) from OSRM API using our traffic module.
-            eta = get_live_travel_time(user_location, driver_location)
-            if eta is None:
-                continue  # Skip this driver if we couldn't retrieve an ETA
-
-            # Calculate driver's average rating dynamically.
-            driver_rating = self.calculate_driver_rating(driver.id)
-
-            # Compute a composite score:
-            # Lower ETA and lower distance are better.
-            # A higher rating reduces the score.
-            composite_score = (weight_eta * eta + weight_distance * distance_km) / driver_rating
-
-            # Select the driver with the lowest composite score.
-            if composite_score < best_score:
-                best_score = composite_score
-                best_driver = driver
-
+        if is_enabled():
+            MATCH_OSRM_CALLS.observe(self.last_match_stats["osrm_calls"])
         return best_driver
+
+    def rank_candidates(self, user_location, drivers):
+        """
+        Stage 1: ranks drivers by a cheap lower bound on their composite score, computed from the
+        Haversine distance, the speed bound and the stored rating.
+        :param drivers: Compatible drivers; any objects with latitude, longitude and rating attributes.
+        :return: List of (lower_bound, distance_km, driver_rating, driver) tuples sorted by lower bound.
+        """
+        with span("match.prescore"):
+            candidates = []
+            for driver in drivers:
+                # Calculate straight-line distance using the Haversine formula from our Graph class.
+                distance_km = self.graph.heuristic(user_location, (driver.latitude, driver.longitude))
+                driver_rating = getattr(driver, self.rating_field, None) or driver.rating or 5.0
+                # No road trip can be faster than the straight line at the speed bound.
+                min_eta = distance_km / self.max_speed_kmh * 60.0
+                lower_bound = self.composite_score(min_eta, distance_km, driver_rating)
+                candidates.append((lower_bound, distance_km, driver_rating, driver))
+            candidates.sort(key=lambda candidate: candidate[0])
+        self.last_match_stats["candidates"] += len(candidates)
+        return candidates
+
+    def pick_best(self, user_location, candidates, best_score=float('inf')):
+        """
+        Stage 2: fetches exact ETAs in lower-bound order until top_k candidates have been scored,
+        stopping early as soon as no remaining lower bound can beat the best exact score.
+        Candidates without an ETA are skipped and the next ones are tried instead, up to
+        max_attempts lookups in total.
+        :param best_score: Score to beat, e.g. the best result found elsewhere.
+        :return: Tuple (best_driver, best_score); best_driver is None if nothing beat best_score.
+        """
+        best_driver = None
+        scored = attempts = 0
+        with span("match.exact"):
+            for lower_bound, distance_km, driver_rating, driver in candidates:
+                if scored >= self.top_k or attempts >= self.max_attempts:
+                    break
+                if lower_bound >= best_score:
+                    break  # Candidates are sorted, so none of the rest can win either
+
+                # Get dynamic ETA (in minutes) from OSRM API, or the ETA matrix if OSRM is down.
+                eta = self.estimate_travel_time(user_location, (driver.latitude, driver.longitude))
+                attempts += 1
+                self.last_match_stats["osrm_calls"] += 1
+                if eta is None:
+                    continue  # Try the next candidate instead
+                scored += 1
+
+                composite_score = self.composite_score(eta, distance_km, driver_rating)
+
+                # Select the driver with the lowest composite score.
+                if composite_score < best_score:
+                    best_score = composite_score
+                    best_driver = driver
+
+        return best_driver, best_score
+
+
+def get_matcher(app):
+    """
+    Returns the app's long-lived RideMatcher, creating it on first use from the MATCH_* config
+    and the ETA matrix store, if one is configured.
+    """
+    matcher = app.extensions.get("ride_matcher")
+    if matcher is None:
+        matcher = app.extensions["ride_matcher"] = RideMatcher(
+            top_k=app.config["MATCH_TOP_K"],
+            max_speed_kmh=app.config["MATCH_MAX_SPEED_KMH"],
+            eta_store=app.extensions.get("eta_matrix"),
+            rating_field=app.config["MATCH_RATING_FIELD"],
+            osrm_timeout=app.config["MATCH_OSRM_TIMEOUT"],
+        )
+    return matcher
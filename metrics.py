@@ -0,0 +1,372 @@
+# metrics.py
+
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Bucket upper bounds in seconds, matching the Prometheus client defaults.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+_enabled = os.getenv("METRICS_ENABLED", "True") == "True"
+_local = threading.local()
+
+# Each process keeps its own REGISTRY. With METRICS_MULTIPROC_DIR set (gunicorn.conf.py does this),
+# every process also writes its observations to a snapshot file there, at most once per
+# SNAPSHOT_INTERVAL seconds, and /metrics renders the sum over all snapshots, so the answer does
+# not depend on which worker serves the scrape.
+_multiproc_dir = os.getenv("METRICS_MULTIPROC_DIR")
+SNAPSHOT_INTERVAL = 1.0
+_last_snapshot = 0.0
+_snapshot_lock = threading.Lock()  # Request threads share one snapshot file per process
+
+
+class Histogram:
+    """
+    Cumulative Prometheus-style histogram with an optional single label.
+    Observations are kept per label value as bucket counts plus a running sum and count.
+    """
+
+    def __init__(self, name, documentation, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        """
+        Records one observation.
+        :param value: Observed value (seconds for timings).
+        :param label_value: Value of the histogram label, if it has one.
+        """
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        """Returns a copy of the recorded series as a {label value: [buckets..., sum, count]} dict."""
+        with self._lock:
+            return {label_value: list(series) for label_value, series in self._series.items()}
+
+    def render(self, series=None):
+        """
+        Renders the histogram in the Prometheus text exposition format.
+        :param series: Series to render instead of this process's own, e.g. merged snapshots.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            series = self.snapshot()
+        series_items = sorted(series.items(), key=lambda item: str(item[0]))
+        for label_value, series in series_items:
+            prefix = f'{self.label}="{label_value}",' if self.label else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            labels = f"{{{prefix.rstrip(',')}}}" if prefix else ""
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+REGISTRY = {}
+
+
+def histogram(name, documentation, label=None, buckets=DEFAULT_BUCKETS):
+    """Returns the registered histogram with the given name, creating it on first use."""
+    if name not in REGISTRY:
+        REGISTRY[name] = Histogram(name, documentation, label=label, buckets=buckets)
+    return REGISTRY[name]
+
+
+STAGE_SECONDS = histogram(
+    "ride_stage_duration_seconds", "Time spent in each matching/routing stage.", label="stage")
+REQUEST_SECONDS = histogram(
+    "ride_request_duration_seconds", "Total request handling time per endpoint.", label="endpoint")
+DB_QUERY_SECONDS = histogram(
+    "ride_db_query_duration_seconds", "Time spent executing individual SQL statements.")
+DB_QUERIES_PER_REQUEST = histogram(
+    "ride_db_queries_per_request", "Number of SQL statements issued per request.", buckets=COUNT_BUCKETS)
+MATCH_OSRM_CALLS = histogram(
+    "ride_match_osrm_calls", "Number of live ETA lookups per find_best_driver call.", buckets=COUNT_BUCKETS)
+WORKER_FIRST_RESPONSE_SECONDS = histogram(
+    "ride_worker_first_response_seconds", "Time from worker process start (or fork) to its first response.")
+WORKER_FIRST_REQUEST_SECONDS = histogram(
+    "ride_worker_first_request_duration_seconds", "Handling time of each worker's first request.")
+RATING_BATCH_SIZE = histogram(
+    "ride_rating_batch_size", "Number of ratings folded into driver aggregates per batch.", buckets=COUNT_BUCKETS)
+RATING_AGGREGATION_LAG_SECONDS = histogram(
+    "ride_rating_aggregation_lag_seconds", "Age of the oldest rating in each aggregated batch.", buckets=LAG_BUCKETS)
+
+_process_started = time.perf_counter()
+_first_request_pending = True
+
+
+def mark_process_start():
+    """Restarts the cold-start clock; call in each worker right after it is forked."""
+    global _process_started, _first_request_pending
+    _process_started = time.perf_counter()
+    _first_request_pending = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+class RequestTimings:
+    """Per-request accumulator for stage durations and SQL statement counts."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.db_count = 0
+        self.db_seconds = 0.0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header_value(self):
+        """Formats the breakdown as `stage;dur=<ms>` entries, similar to Server-Timing."""
+        parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        parts.append(f"db;count={self.db_count};dur={self.db_seconds * 1000:.2f}")
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current_timings():
+    """Returns the RequestTimings of the request being handled on this thread, if any."""
+    return getattr(_local, "timings", None)
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = current_timings()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+@contextmanager
+def _timed_span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def span(stage):
+    """
+    Context manager timing the enclosed block under the given stage name.
+    Returns a shared no-op object when metrics are disabled.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _timed_span(stage)
+
+
+def timed(stage):
+    """Decorator timing every call of the wrapped function under the given stage name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_stage(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# ------------------- SQLALCHEMY QUERY TRACKING ------------------- #
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _enabled:
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    DB_QUERY_SECONDS.observe(elapsed)
+    timings = current_timings()
+    if timings is not None:
+        timings.db_count += 1
+        timings.db_seconds += elapsed
+
+
+_listeners_installed = False
+
+
+def install_query_listeners():
+    """Attaches the timing listeners to every SQLAlchemy engine (idempotent)."""
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _listeners_installed = True
+
+
+# ------------------- FLASK INTEGRATION ------------------- #
+
+def init_app(app):
+    """
+    Hooks request timing into a Flask app.
+    Reads METRICS_ENABLED and TIMING_HEADER from the app config; when TIMING_HEADER is set,
+    each response carries an `X-Timing` header with the per-stage breakdown.
+    """
+    set_enabled(app.config.get("METRICS_ENABLED", _enabled))
+    install_query_listeners()
+
+    @app.before_request
+    def _start_request_timing():
+        if _enabled:
+            _local.timings = RequestTimings()
+
+    @app.after_request
+    def _finish_request_timing(response):
+        global _first_request_pending
+        from flask import request
+
+        timings = current_timings()
+        if timings is None:
+            return response
+        _local.timings = None
+        now = time.perf_counter()
+        REQUEST_SECONDS.observe(now - timings.started, request.endpoint or "unknown")
+        if _first_request_pending:
+            _first_request_pending = False
+            WORKER_FIRST_RESPONSE_SECONDS.observe(now - _process_started)
+            WORKER_FIRST_REQUEST_SECONDS.observe(now - timings.started)
+        DB_QUERIES_PER_REQUEST.observe(timings.db_count)
+        if app.config.get("TIMING_HEADER"):
+            response.headers["X-Timing"] = timings.header_value()
+        if _multiproc_dir:
+            write_snapshot()
+        return response
+
+    @app.teardown_request
+    def _clear_request_timing(exc):
+        _local.timings = None
+
+
+# ------------------- MULTI-PROCESS AGGREGATION ------------------- #
+
+def set_multiproc_dir(path):
+    """Sets (or with None, clears) the directory shared by all processes for metric snapshots."""
+    global _multiproc_dir
+    _multiproc_dir = path
+
+
+def _snapshot_path(pid=None):
+    return os.path.join(_multiproc_dir, f"metrics-{pid or os.getpid()}.json")
+
+
+def write_snapshot(force=False):
+    """
+    Writes this process's observations to its snapshot file in METRICS_MULTIPROC_DIR.
+    Skipped if the last write was less than SNAPSHOT_INTERVAL seconds ago, unless force is set.
+    """
+    global _last_snapshot
+    if not _multiproc_dir:
+        return
+    # Another thread writing right now covers the non-forced case.
+    if not _snapshot_lock.acquire(blocking=force):
+        return
+    try:
+        now = time.monotonic()
+        if not force and now - _last_snapshot < SNAPSHOT_INTERVAL:
+            return
+        _last_snapshot = now
+        # JSON keys must be strings, so each series is stored as a [label value, series] pair.
+        data = {name: [[label_value, series] for label_value, series in h.snapshot().items()]
+                for name, h in REGISTRY.items()}
+        path = _snapshot_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)  # Readers never see a half-written snapshot
+    finally:
+        _snapshot_lock.release()
+
+
+def merged_series():
+    """Sums the snapshots of every process in METRICS_MULTIPROC_DIR; returns {name: {label value: series}}."""
+    merged = {name: {} for name in REGISTRY}
+    for path in glob.glob(os.path.join(_multiproc_dir, "metrics-*.json")):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # Removed or unreadable; skip it rather than fail the scrape
+        for name, pairs in data.items():
+            if name not in merged:
+                continue
+            for label_value, series in pairs:
+                total = merged[name].get(label_value)
+                if total is None or len(total) != len(series):
+                    merged[name][label_value] = list(series)
+                else:
+                    merged[name][label_value] = [a + b for a, b in zip(total, series)]
+    return merged
+
+
+def render_prometheus():
+    """
+    Renders every registered histogram in the Prometheus text exposition format.
+    With METRICS_MULTIPROC_DIR set, renders the sum over all processes' snapshots; otherwise only
+    this process's observations.
+    """
+    if not _multiproc_dir:
+        return "\n".join(h.render() for h in REGISTRY.values()) + "\n"
+    write_snapshot(force=True)
+    merged = merged_series()
+    return "\n".join(h.render(merged[name]) for name, h in REGISTRY.items()) + "\n"
+
+
+def reset():
+    """Clears all recorded observations (used by tests and benchmarks)."""
+    for h in REGISTRY.values():
+        h.reset()
+    if _multiproc_dir and os.path.exists(_snapshot_path()):
+        os.remove(_snapshot_path())
@@ -0,0 +1,72 @@
+"""Baseline schema: user, driver, rating and admin tables
+
+Revision ID: 8a1f0c3e5b21
+Revises: 
+Create Date: 2025-01-06 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a1f0c3e5b21'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created with db.create_all() before migrations existed already have these tables,
+    # so only create the missing ones and let `flask db upgrade` adopt the existing schema.
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'user' not in existing:
+        op.create_table('user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('latitude', sa.Float(), nullable=False),
+            sa.Column('longitude', sa.Float(), nullable=False),
+            sa.Column('smoking', sa.Boolean(), nullable=True),
+            sa.Column('music', sa.Boolean(), nullable=True),
+            sa.Column('pets', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'driver' not in existing:
+        op.create_table('driver',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('latitude', sa.Float(), nullable=False),
+            sa.Column('longitude', sa.Float(), nullable=False),
+            sa.Column('rating', sa.Float(), nullable=True),
+            sa.Column('is_available', sa.Boolean(), nullable=True),
+            sa.Column('smoking', sa.Boolean(), nullable=True),
+            sa.Column('music', sa.Boolean(), nullable=True),
+            sa.Column('pets', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'admin' not in existing:
+        op.create_table('admin',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=100), nullable=False),
+            sa.Column('password', sa.String(length=100), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('username')
+        )
+    if 'rating' not in existing:
+        op.create_table('rating',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('driver_id', sa.Integer(), nullable=False),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['driver_id'], ['driver.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('rating')
+    op.drop_table('admin')
+    op.drop_table('driver')
+    op.drop_table('user')
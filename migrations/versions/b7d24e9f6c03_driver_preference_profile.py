@@ -0,0 +1,36 @@
+"""Add driver.preference_profile and backfill it from the preference flags
+
+Revision ID: b7d24e9f6c03
+Revises: 8a1f0c3e5b21
+Create Date: 2025-01-06 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d24e9f6c03'
+down_revision = '8a1f0c3e5b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('driver', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('preference_profile', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_driver_available_profile', ['is_available', 'preference_profile'], unique=False)
+
+    # Same bit layout as models.encode_preferences: smoking=4, music=2, pets=1.
+    op.execute(
+        "UPDATE driver SET preference_profile = "
+        "(CASE WHEN smoking THEN 4 ELSE 0 END) + "
+        "(CASE WHEN music THEN 2 ELSE 0 END) + "
+        "(CASE WHEN pets THEN 1 ELSE 0 END)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('driver', schema=None) as batch_op:
+        batch_op.drop_index('ix_driver_available_profile')
+        batch_op.drop_column('preference_profile')
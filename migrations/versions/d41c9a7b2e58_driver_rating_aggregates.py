@@ -0,0 +1,70 @@
+"""Add driver rating aggregates and the aggregation checkpoint, backfilled from existing ratings
+
+Revision ID: d41c9a7b2e58
+Revises: b7d24e9f6c03
+Create Date: 2025-01-06 10:10:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41c9a7b2e58'
+down_revision = 'b7d24e9f6c03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('driver', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('rating_sum', sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('recent_rating', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('recent_weight', sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('recent_updated_at', sa.DateTime(), nullable=True))
+
+    op.create_table('aggregation_checkpoint',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+    # Fold the existing ratings in. Their age is unknown to the decayed average at this point,
+    # so they all start at full weight and decay from now on. Timestamps are naive UTC, like the
+    # datetime.utcnow() the aggregator compares them with, so they are passed in rather than taken
+    # from the server clock (CURRENT_TIMESTAMP is local time on some databases).
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    bind.execute(sa.text(
+        "UPDATE driver SET "
+        "rating_count = (SELECT COUNT(*) FROM rating WHERE rating.driver_id = driver.id), "
+        "rating_sum = (SELECT COALESCE(SUM(score), 0) FROM rating WHERE rating.driver_id = driver.id)"
+    ))
+    # ROUND(x, 2) needs a NUMERIC argument on PostgreSQL, which has no round(double precision, int).
+    bind.execute(sa.text(
+        "UPDATE driver SET "
+        "rating = ROUND(CAST(rating_sum / rating_count AS NUMERIC), 2), "
+        "recent_rating = rating_sum / rating_count, "
+        "recent_weight = rating_count, "
+        "recent_updated_at = :now "
+        "WHERE rating_count > 0"
+    ).bindparams(sa.bindparam("now", now, type_=sa.DateTime())))
+    # Same name as rating_aggregator.CHECKPOINT_NAME; the aggregator continues after these ratings.
+    bind.execute(sa.text(
+        "INSERT INTO aggregation_checkpoint (name, last_id, updated_at) "
+        "SELECT 'driver_ratings', COALESCE(MAX(id), 0), :now FROM rating"
+    ).bindparams(sa.bindparam("now", now, type_=sa.DateTime())))
+
+
+def downgrade():
+    op.drop_table('aggregation_checkpoint')
+    with op.batch_alter_table('driver', schema=None) as batch_op:
+        batch_op.drop_column('recent_updated_at')
+        batch_op.drop_column('recent_weight')
+        batch_op.drop_column('recent_rating')
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('rating_count')
@@ -1,8 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 
 db = SQLAlchemy()
 
+def encode_preferences(smoking, music, pets):
+    """Encodes the three boolean preferences (smoking, music, pets) as a profile number between 0 and 7."""
+    return (bool(smoking) << 2) | (bool(music) << 1) | int(bool(pets))
+
+# For each profile, the profiles agreeing on at least 2 of 3 preferences (i.e. differing in at most one bit).
+COMPATIBLE_PROFILES = {
+    profile: tuple(other for other in range(8) if bin(profile ^ other).count("1") <= 1)
+    for profile in range(8)
+}
+
 class User(db.Model):
     """Passenger model."""
     id = db.Column(db.Integer, primary_key=True)
@@ -21,22 +32,29 @@ class Driver(db.Model):
     name = db.Column(db.String(100), nullable=False)
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
-    rating = db.Column(db.Float, default=5.0)  # Dynamic rating
+    rating = db.Column(db.Float, default=5.0)  # Dynamic rating, maintained by rating_aggregator.py
+    rating_count = db.Column(db.Integer, default=0, nullable=False)  # Ratings folded into the aggregates so far
+    rating_sum = db.Column(db.Float, default=0.0, nullable=False)
+    recent_rating = db.Column(db.Float)  # Time-decayed average; None until the first rating is aggregated
+    recent_weight = db.Column(db.Float, default=0.0, nullable=False)  # Total decayed weight as of recent_updated_at
+    recent_updated_at = db.Column(db.DateTime)
     is_available = db.Column(db.Boolean, default=True)
     smoking = db.Column(db.Boolean, default=False)
     music = db.Column(db.Boolean, default=False)
     pets = db.Column(db.Boolean, default=False)
+    preference_profile = db.Column(db.Integer, default=0)  # Derived from smoking/music/pets, kept in sync on save
 
     ratings = db.relationship('Rating', backref='driver', lazy=True)
 
-    def update_rating(self):
-        """Recalculates the driver's rating based on user feedback."""
-        ratings = Rating.query.filter_by(driver_id=self.id).all()
-        if ratings:
-            self.rating = sum(r.score for r in ratings) / len(ratings)
-        else:
-            self.rating = 5.0  # Default if no ratings yet
-        db.session.commit()
+    __table_args__ = (
+        db.Index('ix_driver_available_profile', 'is_available', 'preference_profile'),
+    )
+
+@event.listens_for(Driver, "before_insert")
+@event.listens_for(Driver, "before_update")
+def sync_preference_profile(mapper, connection, driver):
+    """Keeps Driver.preference_profile in sync with the preference flags."""
+    driver.preference_profile = encode_preferences(driver.smoking, driver.music, driver.pets)
 
 class Rating(db.Model):
     """Stores user ratings for drivers."""
@@ -49,6 +67,12 @@ class Rating(db.Model):
     def __repr__(self):
         return f"<Rating(user={self.user_id}, driver={self.driver_id}, score={self.score})>"
 
+class AggregationCheckpoint(db.Model):
+    """Watermark of a background aggregator: the highest row id it has already folded in."""
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Admin(db.Model):
     """Admin model."""
     id = db.Column(db.Integer, primary_key=True)
@@ -1,40 +1,148 @@
-import requests
-from typing import List, Tuple
+import math
+import os
+from typing import List, Optional, Tuple
 import polyline
+from metrics import timed
+from traffic import get_session
 
-OSRM_BASE_URL = "http://router.project-osrm.org"
+OSRM_BASE_URL = os.getenv("OSRM_BASE_URL", "http://router.project-osrm.org")
+DEFAULT_TIMEOUT = 5.0  # Seconds to wait for an OSRM route before giving up
 
-def get_route(start: Tuple[float, float], end: Tuple[float, float]) -> dict:
+GEOMETRY_COORDINATES = "coordinates"  # Decoded list of (latitude, longitude) points
+GEOMETRY_POLYLINE = "polyline"        # Encoded polyline string, passed through from OSRM when not simplified
+GEOMETRY_FORMATS = (GEOMETRY_COORDINATES, GEOMETRY_POLYLINE)
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_PIXEL_ZOOM_0 = 156543.03  # Web Mercator ground resolution at the equator, zoom level 0
+
+def zoom_tolerance(zoom: float, latitude: float) -> float:
+    """
+    Converts a map zoom level into a simplification tolerance of one screen pixel.
+
+    Args:
+        zoom (float): Web map zoom level (0 = whole world, ~18 = street level).
+        latitude (float): Latitude the map is centered on, in degrees.
+
+    Returns:
+        float: Tolerance in meters.
+    """
+    return METERS_PER_PIXEL_ZOOM_0 * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+def simplify_geometry(points: List[Tuple[float, float]], tolerance_m: float) -> List[Tuple[float, float]]:
+    """
+    Simplifies a line with the Douglas-Peucker algorithm.
+
+    Args:
+        points (List[Tuple[float, float]]): Line as (latitude, longitude) points.
+        tolerance_m (float): Maximum distance in meters between the original and the simplified line.
+
+    Returns:
+        List[Tuple[float, float]]: Subset of points, always keeping the first and last.
+    """
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+
+    # Project to a local equirectangular plane in meters; accurate enough at city scale.
+    lat0 = math.radians(points[0][0])
+    scale_x = EARTH_RADIUS_M * math.cos(lat0) * math.pi / 180.0
+    scale_y = EARTH_RADIUS_M * math.pi / 180.0
+    xy = [(lon * scale_x, lat * scale_y) for lat, lon in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if length == 0:
+                dist = math.hypot(px - x1, py - y1)
+            else:
+                dist = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+            if dist > max_dist:
+                max_dist, index = dist, i
+
+        if index is not None and max_dist > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+def _summarize_steps(route: dict) -> List[dict]:
+    """Flattens OSRM leg steps into a compact list of maneuvers."""
+    return [
+        {
+            "name": step.get("name", ""),
+            "maneuver": step.get("maneuver", {}).get("type"),
+            "modifier": step.get("maneuver", {}).get("modifier"),
+            "distance": step.get("distance"),
+            "duration": step.get("duration"),
+        }
+        for leg in route.get("legs", [])
+        for step in leg.get("steps", [])
+    ]
+
+@timed("osrm.route")
+def get_route(start: Tuple[float, float], end: Tuple[float, float],
+              geometry_format: str = GEOMETRY_COORDINATES, tolerance_m: Optional[float] = None,
+              steps: bool = False, timeout: float = DEFAULT_TIMEOUT) -> dict:
     """
     Fetches the optimal route between start and end coordinates using OSRM.
 
     Args:
         start (Tuple[float, float]): Starting coordinates (latitude, longitude).
         end (Tuple[float, float]): Ending coordinates (latitude, longitude).
+        geometry_format (str): "coordinates" for a decoded point list, "polyline" for an encoded string.
+        tolerance_m (Optional[float]): If set, simplify the geometry with Douglas-Peucker at this tolerance.
+        steps (bool): Whether to request and return turn-by-turn steps.
+        timeout (float): Seconds to wait for OSRM; a slower answer raises requests.Timeout.
 
     Returns:
-        dict: Route information including distance, duration, and geometry.
+        dict: Route information including distance, duration, and geometry (plus steps if requested).
     """
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise ValueError(f"Unknown geometry format: {geometry_format}")
+
     coords = f"{start[1]},{start[0]};{end[1]},{end[0]}"
     url = f"{OSRM_BASE_URL}/route/v1/driving/{coords}"
     params = {
         "overview": "full",
         "geometries": "polyline",
-        "steps": True
+        "steps": "true" if steps else "false"
     }
-    response = requests.get(url, params=params)
+    response = get_session().get(url, params=params, timeout=timeout)
     data = response.json()
     if data.get("code") == "Ok":
         route = data["routes"][0]
-        return {
+        geometry = route["geometry"]
+        # The encoded polyline is passed through untouched unless it has to be decoded.
+        if geometry_format == GEOMETRY_COORDINATES or tolerance_m:
+            geometry = polyline.decode(geometry)
+            if tolerance_m:
+                geometry = simplify_geometry(geometry, tolerance_m)
+            if geometry_format == GEOMETRY_POLYLINE:
+                geometry = polyline.encode(geometry)
+        result = {
             "distance": route["distance"],
             "duration": route["duration"],
-            "geometry": polyline.decode(route["geometry"])
+            "geometry": geometry
         }
+        if steps:
+            result["steps"] = _summarize_steps(route)
+        return result
     else:
         raise Exception(f"OSRM error: {data.get('message')}")
 
-def calculate_optimal_route(driver_location: Tuple[float, float], passenger_pickup: Tuple[float, float], passenger_dropoff: Tuple[float, float]) -> dict:
+def calculate_optimal_route(driver_location: Tuple[float, float], passenger_pickup: Tuple[float, float],
+                            passenger_dropoff: Tuple[float, float], geometry_format: str = GEOMETRY_COORDINATES,
+                            tolerance_m: Optional[float] = None, steps: bool = False,
+                            timeout: float = DEFAULT_TIMEOUT) -> dict:
     """
     Determines the optimal route for a ride, including pickup and dropoff points.
 
@@ -42,22 +150,33 @@ def calculate_optimal_route(driver_location: Tuple[float, float], passenger_pick
         driver_location (Tuple[float, float]): Driver's current location (latitude, longitude).
         passenger_pickup (Tuple[float, float]): Passenger's pickup location (latitude, longitude).
         passenger_dropoff (Tuple[float, float]): Passenger's dropoff location (latitude, longitude).
+        geometry_format (str): "coordinates" combines both legs into one point list; "polyline" returns
+            a list with one encoded polyline per leg (encoded strings cannot simply be concatenated).
+        tolerance_m (Optional[float]): Douglas-Peucker tolerance in meters, or None for full detail.
+        steps (bool): Whether to include turn-by-turn steps for each leg.
+        timeout (float): Seconds to wait for each OSRM request.
 
     Returns:
         dict: Optimal route details including total distance, total duration, and combined geometry.
     """
     # Route from driver to passenger pickup
-    to_pickup_route = get_route(driver_location, passenger_pickup)
+    to_pickup_route = get_route(driver_location, passenger_pickup, geometry_format, tolerance_m, steps, timeout)
     # Route from pickup to dropoff
-    to_dropoff_route = get_route(passenger_pickup, passenger_dropoff)
+    to_dropoff_route = get_route(passenger_pickup, passenger_dropoff, geometry_format, tolerance_m, steps, timeout)
 
     # Combine routes
     total_distance = to_pickup_route['distance'] + to_dropoff_route['distance']
     total_duration = to_pickup_route['duration'] + to_dropoff_route['duration']
-    geometry = to_pickup_route['geometry'] + to_dropoff_route['geometry']
+    if geometry_format == GEOMETRY_POLYLINE:
+        geometry = [to_pickup_route['geometry'], to_dropoff_route['geometry']]
+    else:
+        geometry = to_pickup_route['geometry'] + to_dropoff_route['geometry']
 
-    return {
+    result = {
         'total_distance': total_distance,
         'total_duration': total_duration,
         'geometry': geometry
     }
+    if steps:
+        result['steps'] = [to_pickup_route['steps'], to_dropoff_route['steps']]
+    return result
@@ -0,0 +1,297 @@
+# rating_aggregator.py
+"""
+Background aggregation of driver ratings.
+
+/rate_driver only appends a Rating row. This module folds new ratings into the driver aggregates
+in batches: the lifetime average (Driver.rating, with rating_count/rating_sum) and a time-decayed
+average (Driver.recent_rating) that weights each rating by 0.5 ** (age / half_life), so recent
+trips count more. Progress is kept as a watermark (the highest aggregated Rating.id) in the
+aggregation_checkpoint table and advanced in the same transaction as the driver updates, so every
+rating is counted exactly once even with several aggregators running.
+
+Rating ids are handed out when the row is flushed, but the row only becomes visible when its
+transaction commits, so a lower id can appear after a higher one has been aggregated. The
+watermark is therefore gap-aware: a batch stops at a missing id until that gap is gap_seconds
+old, after which the id is taken to belong to a rolled-back transaction (or a deleted rating) and
+skipped. Only a transaction that commits more than gap_seconds after its flush can still be missed.
+
+Production runs this as one process per host (gunicorn.conf.py starts it next to the workers).
+Shard workers pick up the new ratings from the database through the shard service's periodic
+driver refresh (MATCH_SHARD_REFRESH).
+
+Usage:
+    python rating_aggregator.py --interval 2
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam
+
+import metrics
+from models import db, AggregationCheckpoint, Driver, Rating
+
+CHECKPOINT_NAME = "driver_ratings"
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_HALF_LIFE_DAYS = 30.0
+DEFAULT_SETTLE_SECONDS = 1.0
+DEFAULT_GAP_SECONDS = 300.0
+DEFAULT_INTERVAL = 2.0
+
+
+def decay_factor(age_seconds, half_life_seconds):
+    """Weight of a rating that is age_seconds old; ratings from the future count fully."""
+    return 0.5 ** (max(age_seconds, 0.0) / half_life_seconds)
+
+
+class RatingAggregator:
+    """Folds ratings past the checkpoint into the driver aggregates, one batch per run_once call."""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, half_life_days=DEFAULT_HALF_LIFE_DAYS,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS, gap_seconds=DEFAULT_GAP_SECONDS):
+        """
+        :param batch_size: Maximum number of ratings aggregated per batch.
+        :param half_life_days: Age at which a rating counts half in recent_rating.
+        :param settle_seconds: Ratings younger than this are left for the next batch.
+        :param gap_seconds: How long a missing rating id holds back the ratings after it (see the
+                            module docstring).
+        """
+        self.batch_size = batch_size
+        self.half_life_seconds = half_life_days * 86400.0
+        self.settle_seconds = settle_seconds
+        self.gap_seconds = gap_seconds
+
+    def last_id(self):
+        """Returns the checkpoint watermark, creating the checkpoint row on first use."""
+        checkpoint = db.session.get(AggregationCheckpoint, CHECKPOINT_NAME)
+        if checkpoint is not None:
+            return checkpoint.last_id
+        db.session.add(AggregationCheckpoint(name=CHECKPOINT_NAME, last_id=0))
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()  # Another aggregator created it first
+        return db.session.get(AggregationCheckpoint, CHECKPOINT_NAME).last_id
+
+    def fetch_batch(self, last_id, now):
+        """
+        Returns the next ratings after last_id in id order, cut at the first one younger than
+        settle_seconds and at the first id gap younger than gap_seconds.
+        """
+        rows = (
+            db.session.query(Rating.id, Rating.driver_id, Rating.score, Rating.timestamp)
+            .filter(Rating.id > last_id)
+            .order_by(Rating.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        cutoff = now - timedelta(seconds=self.settle_seconds)
+        gap_cutoff = now - timedelta(seconds=self.gap_seconds)
+        expected_id = last_id + 1
+        for i, row in enumerate(rows):
+            if row.timestamp is not None and row.timestamp > cutoff:
+                return rows[:i]
+            # A missing id may still be committed; the row after the gap dates it.
+            if row.id != expected_id and (row.timestamp is None or row.timestamp > gap_cutoff):
+                return rows[:i]
+            expected_id = row.id + 1
+        return rows
+
+    def group_by_driver(self, rows, now):
+        """Sums count, score and decayed score/weight per driver for one batch."""
+        groups = defaultdict(lambda: [0, 0.0, 0.0, 0.0])  # count, score sum, decayed score sum, decayed weight
+        for row in rows:
+            age = (now - row.timestamp).total_seconds() if row.timestamp is not None else 0.0
+            weight = decay_factor(age, self.half_life_seconds)
+            group = groups[row.driver_id]
+            group[0] += 1
+            group[1] += row.score
+            group[2] += weight * row.score
+            group[3] += weight
+        return groups
+
+    def driver_updates(self, groups, now):
+        """Merges the batch groups into the drivers' current aggregates; returns one parameter set per driver."""
+        updates = []
+        drivers = (
+            db.session.query(Driver.id, Driver.rating_count, Driver.rating_sum, Driver.recent_rating,
+                             Driver.recent_weight, Driver.recent_updated_at)
+            .filter(Driver.id.in_(list(groups)))
+            .all()
+        )
+        for driver in drivers:
+            count, score_sum, decayed_sum, decayed_weight = groups[driver.id]
+            total_count = (driver.rating_count or 0) + count
+            total_sum = (driver.rating_sum or 0.0) + score_sum
+
+            # Age the stored decayed aggregate to now before adding the batch.
+            weight = driver.recent_weight or 0.0
+            if weight and driver.recent_rating is not None and driver.recent_updated_at is not None:
+                weight *= decay_factor((now - driver.recent_updated_at).total_seconds(), self.half_life_seconds)
+                decayed_sum += driver.recent_rating * weight
+            decayed_weight += weight
+
+            updates.append({
+                "b_id": driver.id,
+                "b_rating": round(total_sum / total_count, 2),
+                "b_rating_count": total_count,
+                "b_rating_sum": total_sum,
+                "b_recent_rating": round(decayed_sum / decayed_weight, 4) if decayed_weight > 0 else None,
+                "b_recent_weight": decayed_weight,
+                "b_recent_updated_at": now,
+            })
+        return updates
+
+    def run_once(self, now=None):
+        """
+        Aggregates the next batch of ratings.
+        :param now: Reference time for the decay and settle window (defaults to the current UTC time).
+        :return: Number of ratings aggregated; 0 when caught up or another aggregator took the batch.
+        """
+        now = now or datetime.utcnow()
+        last_id = self.last_id()
+        rows = self.fetch_batch(last_id, now)
+        if not rows:
+            db.session.rollback()
+            return 0
+
+        # Claim the batch first: the compare-and-set on the watermark serialises concurrent aggregators.
+        checkpoint = AggregationCheckpoint.__table__
+        claimed = db.session.execute(
+            checkpoint.update()
+            .where(checkpoint.c.name == CHECKPOINT_NAME, checkpoint.c.last_id == last_id)
+            .values(last_id=rows[-1].id, updated_at=now)
+        )
+        if claimed.rowcount != 1:
+            db.session.rollback()
+            return 0
+
+        groups = self.group_by_driver(rows, now)
+        updates = self.driver_updates(groups, now)
+        if updates:
+            # One executemany UPDATE for the whole batch.
+            driver = Driver.__table__
+            db.session.execute(
+                driver.update()
+                .where(driver.c.id == bindparam("b_id"))
+                .values(
+                    rating=bindparam("b_rating"),
+                    rating_count=bindparam("b_rating_count"),
+                    rating_sum=bindparam("b_rating_sum"),
+                    recent_rating=bindparam("b_recent_rating"),
+                    recent_weight=bindparam("b_recent_weight"),
+                    recent_updated_at=bindparam("b_recent_updated_at"),
+                ),
+                updates,
+            )
+        db.session.commit()
+
+        if metrics.is_enabled():
+            metrics.RATING_BATCH_SIZE.observe(len(rows))
+            oldest = min((row.timestamp for row in rows if row.timestamp is not None), default=now)
+            metrics.RATING_AGGREGATION_LAG_SECONDS.observe(max((now - oldest).total_seconds(), 0.0))
+        return len(rows)
+
+    def drain(self, now=None):
+        """Runs batches until caught up; returns the total number of ratings aggregated."""
+        total = 0
+        while True:
+            aggregated = self.run_once(now)
+            if not aggregated:
+                return total
+            total += aggregated
+
+
+def run_batches(aggregator):
+    """
+    One round of the aggregation loop (call inside an app context): drains the new ratings, then
+    writes this process's metrics snapshot. The aggregator serves no requests, so without this its
+    batch metrics would never reach /metrics (see metrics.write_snapshot).
+    :return: Number of ratings aggregated.
+    """
+    started = time.perf_counter()
+    try:
+        aggregated = aggregator.drain()
+    except Exception as e:
+        db.session.rollback()
+        print("Error aggregating ratings:", e)
+        aggregated = 0
+    if aggregated:
+        print(f"Aggregated {aggregated} ratings in {(time.perf_counter() - started) * 1000:.1f} ms")
+    metrics.write_snapshot(force=True)
+    return aggregated
+
+
+class RatingAggregatorThread(threading.Thread):
+    """Background thread draining new ratings every interval seconds inside the app context."""
+
+    def __init__(self, app, aggregator, interval=2.0):
+        super().__init__(daemon=True)
+        self.app = app
+        self.aggregator = aggregator
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self.app.app_context():
+                run_batches(self.aggregator)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def make_aggregator(app):
+    """Builds a RatingAggregator from the RATING_* config."""
+    return RatingAggregator(
+        batch_size=app.config["RATING_BATCH_SIZE"],
+        half_life_days=app.config["RATING_HALF_LIFE_DAYS"],
+        gap_seconds=app.config["RATING_GAP_SECONDS"],
+    )
+
+
+def start_aggregator(app, interval=None):
+    """
+    Starts the app's background aggregation thread, if it is not running yet.
+    :param interval: Seconds between batches (defaults to the RATING_AGGREGATION_INTERVAL config).
+    """
+    thread = app.extensions.get("rating_aggregator")
+    if thread is None:
+        interval = interval or app.config["RATING_AGGREGATION_INTERVAL"]
+        thread = app.extensions["rating_aggregator"] = RatingAggregatorThread(app, make_aggregator(app), interval)
+        thread.start()
+    return thread
+
+
+def spawn_process(interval=DEFAULT_INTERVAL):
+    """Starts the aggregator as a separate process (configured from the same environment)."""
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--interval", str(interval)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate new driver ratings into the driver table.")
+    parser.add_argument("--interval", type=float, help="Keep running and aggregate every N seconds")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app(migrations=False)
+    with app.app_context():
+        aggregator = make_aggregator(app)
+        if not args.interval:
+            print(f"Aggregated {aggregator.drain()} ratings")
+            return
+        while True:
+            run_batches(aggregator)
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
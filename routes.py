@@ -1,12 +1,15 @@
 import hashlib
-import jwt
+import math
+import requests
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify
-from models import db, User, Driver, Admin, Rating
-from matcher import RideMatcher  
+from flask import Blueprint, Response, current_app, request, jsonify
+from models import db, User, Driver, Admin, Rating, encode_preferences
+from matcher import get_matcher
 from dotenv import load_dotenv
 from functools import wraps
-from navigation import calculate_optimal_route
+from navigation import calculate_optimal_route, zoom_tolerance, GEOMETRY_COORDINATES, GEOMETRY_FORMATS
+import metrics
+import sharding
 import os
 
 load_dotenv()
@@ -19,6 +22,8 @@ routes = Blueprint('routes', __name__)
 @routes.route('/admin/login', methods=['POST'])
 def admin_login():
     """Admin login with JWT authentication."""
+    import jwt  # Admin-only dependency, imported lazily to keep worker start-up light
+
     data = request.json
     admin = Admin.query.filter_by(username=data["username"]).first()
 
@@ -37,6 +42,8 @@ def admin_required(func):
     """Decorator to ensure only admins can access certain routes."""
     @wraps(func)
     def wrapper(*args, **kwargs):
+        import jwt  # Admin-only dependency, imported lazily to keep worker start-up light
+
         token = request.headers.get("Authorization")
         if not token:
             return jsonify({"error": "Missing token"}), 403
@@ -74,6 +81,7 @@ def delete_driver(driver_id):
     if driver:
         db.session.delete(driver)
         db.session.commit()
+        sharding.forget_driver(current_app, driver_id)
         return jsonify({"message": "Driver deleted"}), 200
     return jsonify({"error": "Driver not found"}), 404
 
@@ -97,6 +105,7 @@ def create_driver():
     new_driver = Driver(**data)
     db.session.add(new_driver)
     db.session.commit()
+    sharding.sync_driver(current_app, new_driver)
     return jsonify({"message": "Driver created"}), 201
 
 
@@ -109,27 +118,64 @@ def match_user(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    matcher = RideMatcher()
-    best_driver = matcher.find_best_driver(user)
+    best_driver, stats = None, None
+    if current_app.config["MATCH_SHARDS"]:
+        best_driver, stats = _match_sharded(user)
+    if stats is None:
+        matcher = get_matcher(current_app)
+        best_driver = matcher.find_best_driver(user)
+        stats = matcher.last_match_stats
 
     if best_driver:
         return jsonify({
             "driver_id": best_driver.id,
-            "rating": best_driver.rating
+            "rating": best_driver.rating,
+            "osrm_calls": stats["osrm_calls"]
         })
     return jsonify({"message": "No suitable driver found"}), 404
 
 
+def _match_sharded(user):
+    """
+    Routes the match to the shard worker(s) owning the user's region.
+    Returns (None, None) when the caller should match in-process instead: the shard service is
+    unavailable, or its choice is stale (the driver was deleted or went unavailable since its last refresh).
+    """
+    user_profile = encode_preferences(user.smoking, user.music, user.pets)
+    try:
+        driver_id, stats = sharding.get_service(current_app).match((user.latitude, user.longitude), user_profile)
+    except sharding.ShardUnavailable as e:
+        print("Sharded matching unavailable, matching in-process:", e)
+        return None, None
+    if driver_id is None:
+        _observe_osrm_calls(stats)
+        return None, stats
+    best_driver = Driver.query.get(driver_id)
+    if best_driver is None or not best_driver.is_available:
+        return None, None
+    _observe_osrm_calls(stats)
+    return best_driver, stats
+
+
+def _observe_osrm_calls(stats):
+    # The shard workers' RideMatchers cannot observe this per match: one match can span several shards.
+    if metrics.is_enabled():
+        metrics.MATCH_OSRM_CALLS.observe(stats["osrm_calls"])
+
+
 # ------------------- DRIVER RATING SYSTEM ------------------- #
 
 @routes.route('/rate_driver/<int:driver_id>', methods=['POST'])
 def rate_driver(driver_id):
-    """Allows users to rate drivers dynamically, recalculating their average rating."""
+    """
+    Records a user's rating of a driver. The driver's averages are updated asynchronously by
+    rating_aggregator.py, so the response only acknowledges the rating.
+    """
     data = request.json
     user_id = data.get("user_id")
     rating_score = data.get("rating")
 
-    if rating_score is None or not (1 <= rating_score <= 5):
+    if isinstance(rating_score, bool) or not isinstance(rating_score, (int, float)) or not (1 <= rating_score <= 5):
         return jsonify({"error": "Invalid rating. Must be between 1 and 5"}), 400
 
     user = User.query.get(user_id)
@@ -140,21 +186,20 @@ def rate_driver(driver_id):
     if not driver:
         return jsonify({"error": "Driver not found"}), 404
 
-    # Store the new rating
+    # Append the rating event; the aggregator folds it into the driver's averages
+    current_average = driver.rating
     new_rating = Rating(user_id=user_id, driver_id=driver_id, score=rating_score)
     db.session.add(new_rating)
-    db.session.commit()
-
-    # Recalculate the driver's average rating
-    avg_rating = db.session.query(db.func.avg(Rating.score)).filter(Rating.driver_id == driver_id).scalar()
-    driver.rating = round(avg_rating, 2) if avg_rating else 5.0
+    db.session.flush()
+    rating_id = new_rating.id  # Read before commit expires the instance
     db.session.commit()
 
     return jsonify({
         "message": "Rating submitted successfully",
-        "driver_id": driver.id,
-        "new_average_rating": driver.rating
-    }), 200
+        "rating_id": rating_id,
+        "driver_id": driver_id,
+        "current_average_rating": current_average
+    }), 202
 
 
 # ------------------- FETCH USERS & DRIVERS ------------------- #
@@ -208,10 +253,72 @@ def get_driver_ratings(driver_id):
 
 @routes.route('/api/route', methods=['POST'])
 def get_route():
+    """
+    Computes the driver -> pickup -> dropoff route.
+    Optional fields: geometry_format ("coordinates" or "polyline"), tolerance (meters) or zoom
+    for Douglas-Peucker simplification, and steps (bool) for turn-by-turn instructions.
+    There is no departure_time: routes come from OSRM, whose route service has no time-of-day
+    input. Time-of-day speed profiles apply to Graph routing (graph ETAs in the shard matcher).
+    """
     data = request.get_json()
-    driver_location = tuple(data['driver_location'])  # [longitude, latitude]
-    passenger_pickup = tuple(data['passenger_pickup'])  # [longitude, latitude]
-    passenger_dropoff = tuple(data['passenger_dropoff'])  # [longitude, latitude]
-
-    route_info = calculate_optimal_route(driver_location, passenger_pickup, passenger_dropoff)
-    return jsonify(route_info)
\ No newline at end of file
+    driver_location = tuple(data['driver_location'])  # [latitude, longitude]
+    passenger_pickup = tuple(data['passenger_pickup'])  # [latitude, longitude]
+    passenger_dropoff = tuple(data['passenger_dropoff'])  # [latitude, longitude]
+
+    geometry_format = data.get('geometry_format', GEOMETRY_COORDINATES)
+    if geometry_format not in GEOMETRY_FORMATS:
+        return jsonify({"error": f"geometry_format must be one of {', '.join(GEOMETRY_FORMATS)}"}), 400
+    try:
+        tolerance_m = _parse_number(data.get('tolerance'), "tolerance", minimum=0)
+        zoom = _parse_number(data.get('zoom'), "zoom", minimum=0, maximum=24)
+        steps = _parse_bool(data.get('steps', False), "steps")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if tolerance_m is None and zoom is not None:
+        tolerance_m = zoom_tolerance(zoom, passenger_pickup[0])
+
+    try:
+        route_info = calculate_optimal_route(driver_location, passenger_pickup, passenger_dropoff,
+                                             geometry_format=geometry_format, tolerance_m=tolerance_m,
+                                             steps=steps, timeout=current_app.config["ROUTE_OSRM_TIMEOUT"])
+    except requests.Timeout:
+        return jsonify({"error": "Routing service timed out"}), 504
+    return jsonify(route_info)
+
+
+def _parse_number(value, name, minimum=None, maximum=None):
+    """Coerces an optional JSON number (or numeric string) to float, raising ValueError if it is invalid."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(number) or (minimum is not None and number < minimum) or \
+            (maximum is not None and number > maximum):
+        raise ValueError(f"{name} must be between {minimum if minimum is not None else '-inf'} and "
+                         f"{maximum if maximum is not None else 'inf'}")
+    return number
+
+
+def _parse_bool(value, name):
+    """Coerces a JSON boolean, 0/1 or "true"/"false" string to bool, raising ValueError otherwise."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "false", "1", "0"):
+        return value.strip().lower() in ("true", "1")
+    raise ValueError(f"{name} must be true or false")
+
+
+# ------------------- METRICS ------------------- #
+
+@routes.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Exposes stage, request and SQL timings as Prometheus histograms."""
+    if not metrics.is_enabled():
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
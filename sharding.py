@@ -0,0 +1,709 @@
+# sharding.py
+"""
+Region-sharded matching.
+
+One ShardService per host owns the shard worker processes (a ShardedMatcher) and keeps their
+drivers in sync with the database. App processes, e.g. every gunicorn worker, talk to it through
+a ShardClient over multiprocessing.connection.
+
+Usage:
+    python sharding.py --shards 4
+"""
+
+import argparse
+import bisect
+import ipaddress
+import itertools
+import math
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from multiprocessing.connection import Client, Listener
+
+import metrics
+from graphs import Graph
+from matcher import RideMatcher, DEFAULT_TOP_K, DEFAULT_MAX_SPEED_KMH, DEFAULT_OSRM_TIMEOUT
+from models import Driver, COMPATIBLE_PROFILES, encode_preferences
+
+KM_PER_DEGREE_LAT = 111.32
+
+# Picklable snapshot of the driver fields needed for matching.
+DriverRecord = namedtuple("DriverRecord", "id latitude longitude rating preference_profile")
+
+
+class ShardUnavailable(RuntimeError):
+    """A shard worker or the shard service did not answer in time, died or is not running."""
+
+
+def driver_record(driver, rating_field="rating"):
+    """
+    Builds a DriverRecord from a Driver row.
+    :param rating_field: Driver attribute used as the record's rating (see RideMatcher).
+    """
+    profile = driver.preference_profile
+    if profile is None:
+        profile = encode_preferences(driver.smoking, driver.music, driver.pets)
+    rating = getattr(driver, rating_field, None) or driver.rating or 5.0
+    return DriverRecord(driver.id, driver.latitude, driver.longitude, rating, profile)
+
+
+class ShardMap:
+    """
+    Splits the city into vertical longitude strips.
+    Strip i covers longitudes in [boundaries[i-1], boundaries[i]); the outer strips are unbounded,
+    so every point belongs to exactly one shard.
+    """
+
+    def __init__(self, boundaries):
+        self.boundaries = sorted(boundaries)
+
+    @classmethod
+    def from_points(cls, points, shard_count):
+        """Chooses strip boundaries at longitude quantiles so each shard owns about the same number of points."""
+        lons = sorted(lon for _, lon in points)
+        if shard_count <= 1 or not lons:
+            return cls([])
+        boundaries = [lons[len(lons) * i // shard_count] for i in range(1, shard_count)]
+        return cls(boundaries)
+
+    @classmethod
+    def from_range(cls, west, east, shard_count):
+        """Splits the longitudes from west to east into shard_count strips of equal width."""
+        if shard_count <= 1:
+            return cls([])
+        width = (east - west) / shard_count
+        return cls([west + width * i for i in range(1, shard_count)])
+
+    @property
+    def shard_count(self):
+        return len(self.boundaries) + 1
+
+    def shard_of(self, point):
+        return bisect.bisect_right(self.boundaries, point[1])
+
+    def distance_to_shard(self, point, shard):
+        """Approximate east-west distance in km from point to the strip of the given shard (0 if inside)."""
+        lat, lon = point
+        west = self.boundaries[shard - 1] if shard > 0 else -math.inf
+        east = self.boundaries[shard] if shard < len(self.boundaries) else math.inf
+        if west <= lon < east:
+            return 0.0
+        dlon = west - lon if lon < west else lon - east
+        return dlon * KM_PER_DEGREE_LAT * math.cos(math.radians(lat))
+
+
+# ------------------- SHARD WORKER ------------------- #
+
+class ShardMatcher(RideMatcher):
+    """
+    RideMatcher for a shard worker; can take ETAs from the shard's road graph instead of OSRM.
+    Graph ETAs depart now, so edges with a time-of-day speed profile are costed for the current time.
+    """
+
+    def __init__(self, road_graph=None, eta_source="osrm", **kwargs):
+        super().__init__(**kwargs)
+        self.road_graph = road_graph
+        self.eta_source = eta_source
+
+    def estimate_travel_time(self, start, end):
+        if self.eta_source != "graph" or self.road_graph is None:
+            return super().estimate_travel_time(start, end)
+        departure_time = datetime.now() if self.road_graph.speed_profiles else None
+        _, cost = self.road_graph.a_star(self.road_graph.nearest_node(start), self.road_graph.nearest_node(end),
+                                         departure_time=departure_time)
+        return None if cost == float('inf') else cost
+
+
+class ShardState:
+    """In-memory state owned by one shard worker: its drivers, bucketed by preference profile, and a road graph."""
+
+    def __init__(self, road_graph=None, eta_source="osrm", top_k=DEFAULT_TOP_K, max_speed_kmh=DEFAULT_MAX_SPEED_KMH,
+                 osrm_timeout=DEFAULT_OSRM_TIMEOUT, eta_matrix_path=None):
+        self.buckets = {profile: {} for profile in range(8)}
+        self.profiles = {}  # driver id -> profile, to find a driver's bucket on update/removal
+        eta_store = None
+        if eta_matrix_path:
+            from eta_matrix import EtaMatrixStore
+            eta_store = EtaMatrixStore(eta_matrix_path)
+        self.matcher = ShardMatcher(road_graph=road_graph, eta_source=eta_source, top_k=top_k,
+                                    max_speed_kmh=max_speed_kmh, osrm_timeout=osrm_timeout, eta_store=eta_store)
+
+    def load(self, records):
+        for record in records:
+            self.upsert(record)
+        return len(self.profiles)
+
+    def upsert(self, record):
+        self.remove(record.id)
+        self.buckets[record.preference_profile][record.id] = record
+        self.profiles[record.id] = record.preference_profile
+
+    def remove(self, driver_id):
+        profile = self.profiles.pop(driver_id, None)
+        if profile is not None:
+            del self.buckets[profile][driver_id]
+
+    def prepare(self, user_location, user_profile):
+        """Stage 1 over the drivers in the user's compatible buckets; returns the ranked candidates."""
+        self.matcher.last_match_stats = {"candidates": 0, "osrm_calls": 0}
+        drivers = [record for profile in COMPATIBLE_PROFILES[user_profile] for record in self.buckets[profile].values()]
+        return self.matcher.rank_candidates(user_location, drivers)
+
+    def finish(self, user_location, candidates, best_score=float('inf')):
+        """
+        Stage 2 over candidates from prepare(). Only reads the immutable candidate records, so it
+        may run on another thread while the worker keeps applying updates.
+        :return: Tuple (score, driver_id, stats); driver_id is None if nothing beat best_score.
+        """
+        self.matcher.last_match_stats = {"candidates": len(candidates), "osrm_calls": 0}
+        driver, score = self.matcher.pick_best(user_location, candidates, best_score)
+        return score, driver.id if driver else None, self.matcher.last_match_stats
+
+    def match(self, user_location, user_profile, best_score=float('inf')):
+        """Runs the two-stage match over the drivers in the user's compatible buckets (see finish)."""
+        return self.finish(user_location, self.prepare(user_location, user_profile), best_score)
+
+
+def _finish_match(state, outbox, request_id, user_location, candidates, best_score):
+    try:
+        outbox.put((request_id, True, state.finish(user_location, candidates, best_score)))
+    except Exception as e:
+        outbox.put((request_id, False, repr(e)))
+
+
+def _shard_worker(inbox, outbox, options):
+    """
+    Worker process loop: applies (request_id, command, args) messages to its ShardState until it gets None.
+    Commands run one at a time on this thread, except that a match only runs its CPU-bound stage 1
+    here: with OSRM ETAs, stage 2 is handed to a thread pool so concurrent matches wait on OSRM in
+    parallel instead of queueing behind each other.
+    The worker's match and OSRM spans are written to METRICS_MULTIPROC_DIR (see metrics.py), also
+    while idle, so /metrics includes them.
+    """
+    options = dict(options)
+    match_threads = options.pop("match_threads", 1)
+    state = ShardState(**options)
+    pool = None
+    if match_threads > 1 and state.matcher.eta_source != "graph":
+        pool = ThreadPoolExecutor(max_workers=match_threads)
+    while True:
+        metrics.write_snapshot()  # Rate-limited; a no-op without METRICS_MULTIPROC_DIR
+        try:
+            message = inbox.get(timeout=metrics.SNAPSHOT_INTERVAL)
+        except queue.Empty:
+            continue
+        if message is None:
+            break
+        request_id, command, args = message
+        try:
+            if command == "match" and pool is not None:
+                user_location, user_profile, best_score = args
+                candidates = state.prepare(user_location, user_profile)
+                pool.submit(_finish_match, state, outbox, request_id, user_location, candidates, best_score)
+                continue
+            outbox.put((request_id, True, getattr(state, command)(*args)))
+        except Exception as e:
+            outbox.put((request_id, False, repr(e)))
+    if pool is not None:
+        pool.shutdown(wait=False)
+    metrics.write_snapshot(force=True)
+
+
+# ------------------- SHARDED MATCHING SERVICE ------------------- #
+
+class ShardedMatcher:
+    """
+    Runs matching across long-lived worker processes, one per geographic shard.
+    Each worker holds its region's drivers (and optionally the road graph) in memory. A match is sent
+    to the shard owning the user first, then fanned out to the neighbouring shards that are close enough
+    to hold a better driver. Calls that time out or reach a dead worker raise ShardUnavailable.
+    """
+
+    def __init__(self, shard_map, road_graph=None, eta_source="osrm", top_k=DEFAULT_TOP_K,
+                 max_speed_kmh=DEFAULT_MAX_SPEED_KMH, timeout=10.0, osrm_timeout=DEFAULT_OSRM_TIMEOUT,
+                 eta_matrix_path=None, match_threads=16):
+        """
+        :param timeout: Seconds to wait for a shard worker's answer.
+        :param eta_matrix_path: ETA matrix each worker falls back to when OSRM fails (see eta_matrix.py).
+        :param match_threads: Concurrent stage-2 ETA lookups per worker in OSRM mode.
+        """
+        self.shard_map = shard_map
+        self.timeout = timeout
+        self._options = {"road_graph": road_graph, "eta_source": eta_source, "top_k": top_k,
+                         "max_speed_kmh": max_speed_kmh, "osrm_timeout": osrm_timeout,
+                         "eta_matrix_path": eta_matrix_path, "match_threads": match_threads}
+        self._scorer = RideMatcher(top_k=top_k, max_speed_kmh=max_speed_kmh)
+        self._owners = {}   # driver id -> shard
+        self._records = {}  # driver id -> DriverRecord last sent to its shard
+        self._records_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._inboxes = []
+        self._processes = []
+        self._outbox = None
+        self._reader = None
+
+    def start(self):
+        context = multiprocessing.get_context()
+        self._outbox = context.Queue()
+        for _ in range(self.shard_map.shard_count):
+            inbox = context.Queue()
+            process = context.Process(target=_shard_worker, args=(inbox, self._outbox, self._options), daemon=True)
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+        return self
+
+    def stop(self):
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+        if self._outbox is not None:
+            self._outbox.put(None)  # Wakes up the reader thread
+        self._inboxes, self._processes = [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _read_results(self):
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                break
+            request_id, ok, result = message
+            with self._pending_lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue  # The caller already gave up on this request
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(f"Shard worker error: {result}"))
+
+    def _call(self, shard, command, *args):
+        """Sends a command to a shard worker; returns a ticket for _result()."""
+        if shard >= len(self._processes) or not self._processes[shard].is_alive():
+            raise ShardUnavailable(f"Shard {shard} worker is not running")
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._pending_lock:
+            self._pending[request_id] = future
+        self._inboxes[shard].put((request_id, command, args))
+        return shard, request_id, future
+
+    def _result(self, ticket):
+        """Waits for a ticket's answer, failing early if the worker dies and dropping it on timeout."""
+        shard, request_id, future = ticket
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return future.result(min(0.5, max(deadline - time.monotonic(), 0.0)))
+            except FutureTimeoutError:
+                if not self._processes[shard].is_alive():
+                    reason = f"Shard {shard} worker died"
+                elif time.monotonic() >= deadline:
+                    reason = f"Shard {shard} worker did not answer within {self.timeout}s"
+                else:
+                    continue
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise ShardUnavailable(reason)
+
+    def load(self, records):
+        """Distributes DriverRecords to their owning shards and waits until all are loaded."""
+        by_shard = {shard: [] for shard in range(self.shard_map.shard_count)}
+        with self._records_lock:
+            for record in records:
+                shard = self.shard_map.shard_of((record.latitude, record.longitude))
+                by_shard[shard].append(record)
+                self._owners[record.id] = shard
+                self._records[record.id] = record
+        tickets = [self._call(shard, "load", batch) for shard, batch in by_shard.items()]
+        return sum(self._result(ticket) for ticket in tickets)
+
+    def upsert_driver(self, record):
+        """Adds or moves a driver, removing it from its previous shard if it crossed a border."""
+        with self._records_lock:
+            shard = self.shard_map.shard_of((record.latitude, record.longitude))
+            previous = self._owners.get(record.id)
+            if previous is not None and previous != shard:
+                self._call(previous, "remove", record.id)
+            self._owners[record.id] = shard
+            self._records[record.id] = record
+            ticket = self._call(shard, "upsert", record)
+        self._result(ticket)
+
+    def remove_driver(self, driver_id):
+        with self._records_lock:
+            shard = self._owners.pop(driver_id, None)
+            self._records.pop(driver_id, None)
+            ticket = self._call(shard, "remove", driver_id) if shard is not None else None
+        if ticket is not None:
+            self._result(ticket)
+
+    def sync(self, records):
+        """
+        Makes the shards hold exactly the given records (e.g. all available drivers in the database),
+        sending only the drivers that were added, changed or removed.
+        :return: Tuple (upserted, removed).
+        """
+        records = {record.id: record for record in records}
+        with self._records_lock:
+            changed = [record for driver_id, record in records.items() if self._records.get(driver_id) != record]
+            gone = [driver_id for driver_id in self._records if driver_id not in records]
+        for record in changed:
+            self.upsert_driver(record)
+        for driver_id in gone:
+            self.remove_driver(driver_id)
+        return len(changed), len(gone)
+
+    def _fan_out(self, shards, user_location, user_profile, best_score, stats):
+        tickets = [self._call(shard, "match", user_location, user_profile, best_score) for shard in shards]
+        best_driver_id = None
+        for ticket in tickets:
+            score, driver_id, shard_stats = self._result(ticket)
+            stats["candidates"] += shard_stats["candidates"]
+            stats["osrm_calls"] += shard_stats["osrm_calls"]
+            if driver_id is not None and score < best_score:
+                best_score, best_driver_id = score, driver_id
+        stats["shards"] += len(shards)
+        return best_driver_id, best_score
+
+    def match(self, user_location, user_profile):
+        """
+        Finds the best driver for a user across shards.
+        :return: Tuple (driver_id or None, stats dict with candidates, osrm_calls and shards queried).
+        """
+        stats = {"candidates": 0, "osrm_calls": 0, "shards": 0}
+        own = self.shard_map.shard_of(user_location)
+        best_driver_id, best_score = self._fan_out([own], user_location, user_profile, float('inf'), stats)
+
+        # Fan out to other shards only if a driver there could still beat the best score, i.e. if the
+        # lowest possible score at the distance to that shard (perfect rating, speed-bound ETA) is lower.
+        others = []
+        for shard in range(self.shard_map.shard_count):
+            if shard == own:
+                continue
+            distance_km = self.shard_map.distance_to_shard(user_location, shard)
+            bound = self._scorer.composite_score(distance_km / self._scorer.max_speed_kmh * 60.0, distance_km, 5.0)
+            if bound < best_score:
+                others.append(shard)
+        if others:
+            driver_id, best_score = self._fan_out(others, user_location, user_profile, best_score, stats)
+            if driver_id is not None:
+                best_driver_id = driver_id
+        return best_driver_id, stats
+
+
+# ------------------- PER-HOST SERVICE ------------------- #
+
+class ShardService:
+    """
+    Serves a ShardedMatcher to the app processes on this host, one thread per client connection.
+    multiprocessing.connection unpickles whatever an authenticated client sends, so the authkey
+    guards code execution in this process and must be secret (see service_authkey).
+    """
+
+    COMMANDS = ("match", "upsert_driver", "remove_driver")
+
+    def __init__(self, matcher, address, authkey):
+        if not authkey:
+            raise ValueError("The shard service needs an authkey")
+        self.matcher = matcher
+        self.listener = Listener(address, authkey=authkey)
+        self._closed = False
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def serve_forever(self):
+        while not self._closed:
+            try:
+                connection = self.listener.accept()
+            except (OSError, multiprocessing.AuthenticationError):
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        with connection:
+            while True:
+                try:
+                    command, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if command not in self.COMMANDS:
+                    connection.send((False, f"Unknown command {command!r}"))
+                    continue
+                try:
+                    connection.send((True, getattr(self.matcher, command)(*args)))
+                except Exception as e:
+                    connection.send((False, repr(e)))
+
+    def close(self):
+        self._closed = True
+        self.listener.close()
+
+
+class ShardClient:
+    """Client for the host's ShardService; keeps one connection per thread and reconnects after errors."""
+
+    def __init__(self, address, authkey, timeout=10.0):
+        if not authkey:
+            raise ValueError("The shard client needs an authkey")
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _request(self, command, *args):
+        try:
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = self._local.connection = Client(self.address, authkey=self.authkey)
+            connection.send((command, args))
+            if not connection.poll(self.timeout):
+                raise TimeoutError(f"no answer within {self.timeout}s")
+            ok, result = connection.recv()
+        except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+            # The connection may still deliver a late answer, so never reuse it.
+            connection = getattr(self._local, "connection", None)
+            self._local.connection = None
+            if connection is not None:
+                connection.close()
+            raise ShardUnavailable(f"Shard service at {self.address} unavailable: {e}") from e
+        if not ok:
+            raise ShardUnavailable(f"Shard service error: {result}")
+        return result
+
+    def match(self, user_location, user_profile):
+        return self._request("match", user_location, user_profile)
+
+    def upsert_driver(self, record):
+        return self._request("upsert_driver", record)
+
+    def remove_driver(self, driver_id):
+        return self._request("remove_driver", driver_id)
+
+
+class DriverRefresher(threading.Thread):
+    """Background thread reconciling the shards with the available drivers in the database every interval seconds."""
+
+    def __init__(self, app, matcher, interval=5.0):
+        super().__init__(daemon=True)
+        self.app = app
+        self.matcher = matcher
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def refresh(self):
+        with self.app.app_context():
+            return self.matcher.sync(load_records(self.app))
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Error refreshing shard drivers:", e)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def parse_address(address):
+    """Turns "host:port" into a (host, port) tuple."""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # A host name other than localhost
+
+
+def service_address(app):
+    """
+    Returns MATCH_SHARD_ADDRESS as a (host, port) tuple. Anything but a loopback address is
+    refused unless MATCH_SHARD_ALLOW_REMOTE is set, since the service runs code for any client
+    holding the authkey.
+    """
+    host, port = parse_address(app.config["MATCH_SHARD_ADDRESS"])
+    if not is_loopback(host) and not app.config.get("MATCH_SHARD_ALLOW_REMOTE"):
+        raise RuntimeError(f"MATCH_SHARD_ADDRESS {host}:{port} is not a loopback address; "
+                           "set MATCH_SHARD_ALLOW_REMOTE=True to serve other hosts")
+    return host, port
+
+
+def service_authkey(app):
+    """
+    Returns MATCH_SHARD_AUTHKEY, the shared secret between the shard service and its clients.
+    It is required, rather than derived from SECRET_KEY, whose fallback value is public.
+    """
+    authkey = app.config.get("MATCH_SHARD_AUTHKEY")
+    if not authkey:
+        raise RuntimeError("MATCH_SHARD_AUTHKEY must be set to use the shard service (MATCH_SHARDS)")
+    return authkey.encode()
+
+
+def build_shard_map(app):
+    """
+    Builds the MATCH_SHARDS strips from MATCH_SHARD_LON_RANGE ("west,east"), if set, or else from
+    the positions of all drivers, available or not, so the strips do not depend on who happens to
+    be online at start-up. Returns None if there is neither a range nor any driver yet.
+    """
+    shard_count = app.config["MATCH_SHARDS"]
+    lon_range = app.config.get("MATCH_SHARD_LON_RANGE")
+    if lon_range:
+        west, east = (float(lon) for lon in lon_range.split(","))
+        return ShardMap.from_range(west, east, shard_count)
+    with app.app_context():
+        points = Driver.query.with_entities(Driver.latitude, Driver.longitude).all()
+    if not points:
+        return None
+    return ShardMap.from_points(points, shard_count)
+
+
+def load_road_graph(app):
+    """Returns the road graph for MATCH_ETA_SOURCE="graph", loaded from MATCH_ROAD_GRAPH_PATH, or None for OSRM ETAs."""
+    eta_source = app.config["MATCH_ETA_SOURCE"]
+    if eta_source not in ("osrm", "graph"):
+        raise ValueError(f"MATCH_ETA_SOURCE must be 'osrm' or 'graph', got {eta_source!r}")
+    if eta_source == "osrm":
+        return None
+    if not app.config["MATCH_ROAD_GRAPH_PATH"]:
+        raise ValueError("MATCH_ETA_SOURCE='graph' needs MATCH_ROAD_GRAPH_PATH")
+    return Graph.load(app.config["MATCH_ROAD_GRAPH_PATH"])
+
+
+def load_records(app):
+    """Builds DriverRecords for all available drivers (call inside an app context)."""
+    rating_field = app.config["MATCH_RATING_FIELD"]
+    return [driver_record(d, rating_field) for d in Driver.query.filter_by(is_available=True).all()]
+
+
+def serve(app):
+    """
+    Runs the host's shard service until interrupted: starts MATCH_SHARDS workers, loads the
+    available drivers and keeps them in sync with the database every MATCH_SHARD_REFRESH seconds.
+    With MATCH_ETA_SOURCE="graph", ETAs come from the road graph saved at MATCH_ROAD_GRAPH_PATH
+    (see Graph.save) instead of OSRM.
+    """
+    address, authkey = service_address(app), service_authkey(app)  # Refuse an unsafe set-up up front
+    road_graph = load_road_graph(app)
+    shard_map = build_shard_map(app)
+    while shard_map is None:
+        # Strips from no points would collapse into a single shard for the life of the process.
+        print("No drivers to place the shard boundaries yet (set MATCH_SHARD_LON_RANGE to skip this); "
+              f"retrying in {app.config['MATCH_SHARD_REFRESH']}s")
+        time.sleep(app.config["MATCH_SHARD_REFRESH"])
+        shard_map = build_shard_map(app)
+    if shard_map.shard_count != app.config["MATCH_SHARDS"]:
+        print(f"Warning: running {shard_map.shard_count} shards instead of MATCH_SHARDS={app.config['MATCH_SHARDS']}")
+    with app.app_context():
+        records = load_records(app)
+    matcher = ShardedMatcher(
+        shard_map,
+        road_graph=road_graph,
+        eta_source=app.config["MATCH_ETA_SOURCE"],
+        top_k=app.config["MATCH_TOP_K"],
+        max_speed_kmh=app.config["MATCH_MAX_SPEED_KMH"],
+        osrm_timeout=app.config["MATCH_OSRM_TIMEOUT"],
+        timeout=app.config["MATCH_SHARD_TIMEOUT"],
+        eta_matrix_path=app.config["ETA_MATRIX_PATH"],
+    ).start()
+    refresher = DriverRefresher(app, matcher, app.config["MATCH_SHARD_REFRESH"])
+    service = ShardService(matcher, address, authkey)
+    try:
+        matcher.load(records)
+        refresher.start()
+        print(f"Serving {len(records)} drivers on {shard_map.shard_count} shards at {service.address}")
+        service.serve_forever()
+    finally:
+        refresher.stop()
+        service.close()
+        matcher.stop()
+
+
+def spawn_service():
+    """Starts the shard service as a separate process (configured from the same environment)."""
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__)])
+
+
+# ------------------- FLASK INTEGRATION ------------------- #
+
+def get_service(app):
+    """Returns the app's ShardClient for the host's shard service at MATCH_SHARD_ADDRESS."""
+    client = app.extensions.get("shard_client")
+    if client is None:
+        client = app.extensions["shard_client"] = ShardClient(
+            service_address(app),
+            service_authkey(app),
+            timeout=app.config["MATCH_SHARD_TIMEOUT"],
+        )
+    return client
+
+
+def sync_driver(app, driver):
+    """
+    Pushes a created or updated driver to the shard service right away. Best effort: the service's
+    periodic refresh from the database is what keeps the shards correct.
+    """
+    if not app.config["MATCH_SHARDS"]:
+        return
+    try:
+        if driver.is_available:
+            get_service(app).upsert_driver(driver_record(driver, app.config["MATCH_RATING_FIELD"]))
+        else:
+            get_service(app).remove_driver(driver.id)
+    except ShardUnavailable as e:
+        print("Could not push driver to the shard service:", e)
+
+
+def forget_driver(app, driver_id):
+    """Removes a deleted driver from the shard service right away (best effort, see sync_driver)."""
+    if not app.config["MATCH_SHARDS"]:
+        return
+    try:
+        get_service(app).remove_driver(driver_id)
+    except ShardUnavailable as e:
+        print("Could not remove driver from the shard service:", e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the per-host sharded matching service.")
+    parser.add_argument("--shards", type=int, help="Number of shard workers (default: MATCH_SHARDS)")
+    parser.add_argument("--address", help="host:port to listen on (default: MATCH_SHARD_ADDRESS)")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app(migrations=False)
+    if args.shards:
+        app.config["MATCH_SHARDS"] = args.shards
+    if args.address:
+        app.config["MATCH_SHARD_ADDRESS"] = args.address
+    serve(app)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,3 +22,59 @@ def test_index_route(client):
     # Assuming you have a simple index route or can call one of your routes.
     response = client.get('/users')  # For example, retrieving users.
     assert response.status_code in [200, 404]  # It may be empty initially.
+
+def test_create_app_without_migrations():
+    app = create_app(migrations=False)
+    assert 'migrate' not in app.extensions
+    assert 'migrate' in create_app().extensions
+
+ROUTE_REQUEST = {
+    "driver_location": [52.52, 13.40],
+    "passenger_pickup": [52.51, 13.41],
+    "passenger_dropoff": [52.50, 13.42],
+}
+
+def test_route_rejects_invalid_options(client):
+    for options in ({"tolerance": "ten"}, {"tolerance": -1}, {"zoom": 40}, {"zoom": True}, {"steps": "maybe"}):
+        response = client.post('/api/route', json=dict(ROUTE_REQUEST, **options))
+        assert response.status_code == 400, options
+
+def test_route_coerces_options(client, monkeypatch):
+    seen = {}
+    def fake_route(*points, **kwargs):
+        seen.update(kwargs)
+        return {"distance": 0, "duration": 0}
+    monkeypatch.setattr("routes.calculate_optimal_route", fake_route)
+
+    response = client.post('/api/route', json=dict(ROUTE_REQUEST, tolerance="5", steps="false"))
+    assert response.status_code == 200
+    assert seen["tolerance_m"] == 5.0 and seen["steps"] is False
+    assert seen["timeout"] == 5.0
+
+def test_route_times_out(client, monkeypatch):
+    import requests
+    def slow_route(*points, **kwargs):
+        raise requests.Timeout("read timed out")
+    monkeypatch.setattr("routes.calculate_optimal_route", slow_route)
+
+    response = client.post('/api/route', json=ROUTE_REQUEST)
+    assert response.status_code == 504
+
+def test_sharded_match_observes_osrm_calls(app, client, monkeypatch):
+    import metrics
+    from models import User, Driver
+    with app.app_context():
+        db.session.add(User(name="Rider", latitude=52.5, longitude=13.4, smoking=False, music=True, pets=True))
+        db.session.add(Driver(name="Driver", latitude=52.5, longitude=13.41, smoking=False, music=True, pets=True))
+        db.session.commit()
+
+    class FakeService:
+        def match(self, user_location, user_profile):
+            return 1, {"candidates": 1, "osrm_calls": 3, "shards": 1}
+    app.config["MATCH_SHARDS"] = 2
+    monkeypatch.setattr("sharding.get_service", lambda app: FakeService())
+    metrics.MATCH_OSRM_CALLS.reset()
+
+    response = client.get('/match/1')
+    assert response.get_json()["osrm_calls"] == 3
+    assert metrics.MATCH_OSRM_CALLS.snapshot()[None][-2:] == [3, 1]  # sum, count
@@ -0,0 +1,57 @@
+from benchmarks.stats import percentile, summarize, run_load
+from benchmarks.synthetic import (
+    assign_speed_profiles, build_grid_graph, generate_drivers, generate_ratings, generate_users,
+)
+
+def test_synthetic_data_is_reproducible():
+    assert generate_users(20, seed=1) == generate_users(20, seed=1)
+    assert generate_drivers(20, seed=1) == generate_drivers(20, seed=1)
+    assert generate_users(20, seed=1) != generate_users(20, seed=2)
+
+def test_generate_ratings_in_range():
+    ratings = generate_ratings(user_count=10, driver_count=4, ratings_per_driver=3)
+    assert len(ratings) == 12
+    assert all(1 <= r["score"] <= 5 for r in ratings)
+    assert all(1 <= r["user_id"] <= 10 for r in ratings)
+
+def test_grid_graph_is_connected():
+    graph, nodes = build_grid_graph(5, 5, seed=0)
+    assert len(nodes) == 25
+    path, cost = graph.a_star(nodes[0], nodes[-1])
+    assert path[0] == nodes[0] and path[-1] == nodes[-1]
+    assert cost < float('inf')
+
+def test_assign_speed_profiles():
+    graph, nodes = build_grid_graph(4, 4, seed=0, diagonal_ratio=0)
+    assert assign_speed_profiles(graph, seed=0) == 24  # 2 * 4 * 3 grid edges
+    profile = graph.speed_profiles[(nodes[0], nodes[1])]
+    assert min(profile) < 0.9 <= max(profile)  # Slower at rush hour than at night
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+def test_summarize_and_run_load():
+    summary = summarize([0.001, 0.002, 0.003], wall_seconds=1.0, errors=1)
+    assert summary["requests"] == 4
+    assert summary["requests_per_second"] == 3.0
+    assert summary["p50_ms"] == 2.0
+
+    result = run_load(lambda i: i % 2 == 0, total=10, concurrency=2)
+    assert result["requests"] == 10
+    assert result["errors"] == 5
+
+def test_osrm_stub_serves_multi_point_route():
+    import json
+    import urllib.request
+    import polyline
+    from benchmarks.osrm_stub import OSRMStub
+
+    with OSRMStub(latency_ms=0, jitter_ms=0) as stub:
+        url = f"{stub.base_url}/route/v1/driving/13.40,52.52;13.42,52.52?overview=full&geometries=polyline"
+        with urllib.request.urlopen(url) as response:
+            route = json.loads(response.read())["routes"][0]
+    assert route["distance"] > 0 and route["duration"] > 0
+    assert len(polyline.decode(route["geometry"])) > 2
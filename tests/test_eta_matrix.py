@@ -0,0 +1,47 @@
+import numpy as np
+from graphs import Graph
+from eta_matrix import ZoneGrid, EtaMatrix, EtaMatrixStore, build_from_graph
+
+def make_grid():
+    # Roughly 2 x 2 zones of 1 km around the origin.
+    return ZoneGrid(0.0, 0.0, 0.017, 0.017, cell_km=1.0)
+
+def test_zone_grid_lookup():
+    grid = make_grid()
+    assert grid.size == 4
+    assert grid.zone_of((0.001, 0.001)) == 0
+    assert grid.zone_of((0.016, 0.016)) == 3
+    assert grid.zone_of((1.0, 1.0)) is None
+    assert grid.zone_of(grid.center(2)) == 2
+
+def test_build_from_graph():
+    grid = make_grid()
+    graph = Graph()
+    centers = grid.centers()
+    graph.add_edge(centers[0], centers[1], 3)
+    graph.add_edge(centers[1], centers[3], 4)
+    matrix = build_from_graph(grid, graph)
+    assert matrix.lookup(centers[0], centers[3]) == 7
+    assert matrix.lookup(centers[3], centers[0]) == 7
+    assert matrix.lookup(centers[0], (1.0, 1.0)) is None  # Outside the grid
+
+def test_save_and_load_roundtrip(tmp_path):
+    grid = make_grid()
+    minutes = np.arange(16, dtype=np.float32).reshape(4, 4)
+    path = str(tmp_path / "eta.npy")
+    EtaMatrix(grid, minutes, source="test").save(path)
+
+    loaded = EtaMatrixStore(path).get()
+    assert loaded.source == "test"
+    assert isinstance(loaded.minutes, np.memmap)
+    assert loaded.lookup(grid.center(1), grid.center(2)) == 6.0
+
+def test_save_replaces_grid_and_array_together(tmp_path):
+    path = str(tmp_path / "eta.npy")
+    EtaMatrix(make_grid(), np.zeros((4, 4), dtype=np.float32)).save(path)
+    wider = ZoneGrid(0.0, 0.0, 0.017, 0.026, cell_km=1.0)
+    EtaMatrix(wider, np.ones((wider.size, wider.size), dtype=np.float32)).save(path)
+
+    loaded = EtaMatrix.load(path)
+    assert loaded.minutes.shape == (wider.size, wider.size)
+    assert len(list(tmp_path.glob("eta.npy.*.npy"))) == 1  # The old array version is cleaned up
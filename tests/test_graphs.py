@@ -1,5 +1,7 @@
 import math
-from graphs import Graph
+from datetime import datetime
+import pytest
+from graphs import Graph, SLOT_MINUTES, SLOTS_PER_DAY
 
 def test_heuristic():
     # Test the Haversine formula between two points
@@ -37,3 +39,67 @@ def test_a_star():
     path, cost = graph.a_star(A, C)
     assert path == [A, B, C]
     assert cost == 10
+
+def test_dijkstra_and_nearest_node():
+    graph = Graph()
+    A = (0, 0)
+    B = (0, 1)
+    C = (1, 1)
+    graph.add_edge(A, B, 5)
+    graph.add_edge(B, C, 5)
+    graph.add_edge(A, C, 20)
+    dist = graph.dijkstra(A)
+    assert dist == {A: 0, B: 5, C: 10}
+    assert graph.nearest_node((0.9, 1.1)) == C
+
+def test_time_dependent_a_star():
+    # Two routes from A to D: a highway via B that is congested at rush hour and a side road via C.
+    # Nodes are ~11 m apart so the Haversine heuristic stays well below the edge costs.
+    graph = Graph()
+    A, B, C, D = (0, 0), (0, 0.0001), (0.0001, 0), (0.0001, 0.0001)
+    graph.add_edge(A, B, 5)
+    graph.add_edge(B, D, 5)
+    graph.add_edge(A, C, 8)
+    graph.add_edge(C, D, 8)
+    rush_hour = [1.0] * SLOTS_PER_DAY
+    for slot in range(8 * 60 // SLOT_MINUTES, 9 * 60 // SLOT_MINUTES):
+        rush_hour[slot] = 0.25  # Four times slower between 08:00 and 09:00
+    graph.set_speed_profile(B, D, rush_hour)
+
+    # Without a departure time the static weights are used.
+    assert graph.a_star(A, D) == ([A, B, D], 10)
+    # Leaving at 07:50, the B-D edge is reached at 07:55 and is still free-flowing.
+    assert graph.a_star(A, D, departure_time=7 * 60 + 50) == ([A, B, D], 10)
+    # Leaving at 07:56, B is reached at 08:01 and B-D would take 20 minutes; the side road wins.
+    path, cost = graph.a_star(A, D, departure_time=datetime(2024, 1, 1, 7, 56))
+    assert path == [A, C, D]
+    assert cost == 16
+
+def test_speed_profile_validation_and_memory():
+    graph = Graph()
+    A, B = (0, 0), (0, 1)
+    graph.add_edge(A, B, 10)
+    graph.set_speed_profile(A, B, [0.5] * SLOTS_PER_DAY)
+    # Both directions share one array of 4-byte floats.
+    assert graph.profile_memory_bytes() == SLOTS_PER_DAY * 4
+    # Slot lookups wrap around midnight.
+    assert graph.get_edge_weight_at(A, B, 10, 24 * 60 + 5) == 20
+    with pytest.raises(ValueError):
+        graph.set_speed_profile(A, B, [1.0] * 10)
+
+def test_save_and_load_round_trip(tmp_path):
+    graph = Graph()
+    A, B, C = (0, 0), (0, 0.0001), (0.0001, 0)
+    graph.add_edge(A, B, 5)
+    graph.add_edge(B, C, 8, bidirectional=False)
+    graph.add_edge(C, A, 3, bidirectional=False)
+    graph.update_edge_weight(A, B, 7)
+    graph.set_speed_profile(A, B, [0.5] * SLOTS_PER_DAY)
+    graph.save(tmp_path / "graph.json")
+
+    loaded = Graph.load(tmp_path / "graph.json")
+    assert loaded.a_star(A, C) == graph.a_star(A, C) == ([A, B, C], 15)
+    assert loaded.a_star(C, B) == ([C, A, B], 10)  # B-C stays one-way
+    assert loaded.a_star(A, B, departure_time=0) == ([A, B], 10)
+    # The profile is still shared between both directions.
+    assert loaded.profile_memory_bytes() == SLOTS_PER_DAY * 4
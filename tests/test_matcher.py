@@ -1,4 +1,5 @@
-from models import User, Driver
+import pytest
+from models import User, Driver, encode_preferences
 from matcher import RideMatcher
 from graphs import Graph
 
@@ -20,6 +21,7 @@ class DummyDriver:
         self.pets = pets
         self.rating = rating
         self.is_available = is_available
+        self.preference_profile = encode_preferences(smoking, music, pets)
 
 # Override Driver.query.filter_by to return a list of dummy drivers for testing.
 class DummyDriverQuery:
@@ -27,10 +29,26 @@ class DummyDriverQuery:
         self.drivers = drivers
 
     def filter_by(self, **kwargs):
-        available = [d for d in self.drivers if d.is_available]
-        return available
+        return DummyDriverQuery([d for d in self.drivers if d.is_available])
 
-def test_find_best_driver(monkeypatch):
+    def filter(self, criterion):
+        # Supports the `column.in_(values)` criterion used by the matcher.
+        key, values = criterion.left.key, criterion.right.value
+        return DummyDriverQuery([d for d in self.drivers if getattr(d, key) in values])
+
+    def all(self):
+        return list(self.drivers)
+
+@pytest.fixture
+def driver_query():
+    """Replaces Driver.query with a DummyDriverQuery for one test, then restores the real query property."""
+    def install(drivers):
+        Driver.query = DummyDriverQuery(drivers)
+    yield install
+    if "query" in Driver.__dict__:
+        del Driver.query
+
+def test_find_best_driver(monkeypatch, driver_query):
     # Create a dummy user and two dummy drivers.
     user = DummyUser(40.7128, -74.0060, smoking=False, music=True, pets=True)
     driver1 = DummyDriver(1, 40.7138, -74.0050, smoking=False, music=True, pets=True, rating=4.5)
@@ -38,13 +56,90 @@ def test_find_best_driver(monkeypatch):
     dummy_drivers = [driver1, driver2]
 
     # Monkey-patch Driver.query.filter_by to return our dummy drivers
-    from models import Driver
-    Driver.query = DummyDriverQuery(dummy_drivers)
+    driver_query(dummy_drivers)
 
     # Also, override the traffic function to return a fixed ETA.
-    monkeypatch.setattr("matcher.get_live_travel_time", lambda start, end: 10)
+    monkeypatch.setattr("matcher.get_live_travel_time", lambda start, end, timeout=None: 10)
 
     matcher = RideMatcher()
     best = matcher.find_best_driver(user)
     # In this dummy scenario, driver1 matches all preferences, so it should be selected.
     assert best.id == 1
+
+class DummyEtaMatrix:
+    def lookup(self, start, end):
+        return 7.5
+
+def test_estimate_travel_time_falls_back_to_eta_matrix(monkeypatch):
+    monkeypatch.setattr("matcher.get_live_travel_time", lambda start, end, timeout=None: None)
+    assert RideMatcher().estimate_travel_time((0, 0), (0, 1)) is None
+    assert RideMatcher(eta_matrix=DummyEtaMatrix()).estimate_travel_time((0, 0), (0, 1)) == 7.5
+
+def test_two_stage_matching_limits_osrm_calls(monkeypatch, driver_query):
+    user = DummyUser(40.7128, -74.0060, smoking=False, music=True, pets=True)
+    # One nearby driver and several far away ones that can never win.
+    near = DummyDriver(1, 40.7130, -74.0058, smoking=False, music=True, pets=True)
+    far = [DummyDriver(i, 40.7128 + i * 0.1, -74.0060, smoking=False, music=True, pets=True) for i in range(2, 10)]
+    incompatible = DummyDriver(10, 40.7128, -74.0060, smoking=True, music=False, pets=True)
+    driver_query([near, incompatible] + far)
+
+    calls = []
+    def fake_eta(start, end, timeout=None):
+        calls.append(end)
+        return 1
+    monkeypatch.setattr("matcher.get_live_travel_time", fake_eta)
+
+    matcher = RideMatcher(top_k=3)
+    best = matcher.find_best_driver(user)
+    assert best.id == 1
+    assert matcher.last_match_stats["candidates"] == 9
+    # The nearby driver's exact score beats every remaining lower bound, so stage 2 stops early.
+    assert matcher.last_match_stats["osrm_calls"] == len(calls) == 1
+
+def test_last_match_stats_are_per_thread():
+    import threading
+    matcher = RideMatcher()
+    matcher.last_match_stats = {"candidates": 3, "osrm_calls": 2}
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(matcher.last_match_stats))
+    thread.start()
+    thread.join()
+    assert seen == [{"candidates": 0, "osrm_calls": 0}]
+    assert matcher.last_match_stats["osrm_calls"] == 2
+
+def test_rank_candidates_uses_configured_rating_field():
+    steady = DummyDriver(1, 40.0, -74.0, False, True, True, rating=4.0)
+    steady.recent_rating = 2.0
+    unrated = DummyDriver(2, 40.0, -74.0, False, True, True, rating=4.0)
+    unrated.recent_rating = None
+    matcher = RideMatcher(rating_field="recent_rating")
+    ratings = {driver.id: rating for _, _, rating, driver in matcher.rank_candidates((40.0, -74.0), [steady, unrated])}
+    assert ratings == {1: 2.0, 2: 4.0}  # Falls back to the lifetime rating
+
+def test_pick_best_looks_past_failed_etas(monkeypatch, driver_query):
+    user = DummyUser(40.7128, -74.0060, smoking=False, music=True, pets=True)
+    drivers = [DummyDriver(i, 40.7128 + i * 0.01, -74.0060, smoking=False, music=True, pets=True) for i in range(1, 5)]
+    driver_query(drivers)
+    # No ETA for the three nearest drivers.
+    monkeypatch.setattr("matcher.get_live_travel_time",
+                        lambda start, end, timeout=None: 10 if end == (drivers[3].latitude, drivers[3].longitude) else None)
+
+    matcher = RideMatcher(top_k=2)
+    assert matcher.find_best_driver(user).id == 4
+    assert matcher.last_match_stats["osrm_calls"] == 4
+
+def test_pick_best_caps_attempts_when_every_eta_fails(monkeypatch, driver_query):
+    user = DummyUser(40.7128, -74.0060, smoking=False, music=True, pets=True)
+    drivers = [DummyDriver(i, 40.7128 + i * 0.001, -74.0060, smoking=False, music=True, pets=True)
+               for i in range(1, 501)]
+    driver_query(drivers)
+    monkeypatch.setattr("matcher.get_live_travel_time", lambda start, end, timeout=None: None)
+
+    matcher = RideMatcher(top_k=5)
+    assert matcher.find_best_driver(user) is None
+    assert matcher.last_match_stats["osrm_calls"] == 10  # 2 * top_k, not one per driver
+
+    user_location = (user.latitude, user.longitude)
+    matcher = RideMatcher(top_k=5, max_attempts=3)
+    assert matcher.pick_best(user_location, matcher.rank_candidates(user_location, drivers)) == (None, float('inf'))
+    assert matcher.last_match_stats["osrm_calls"] == 3
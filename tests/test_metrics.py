@@ -0,0 +1,81 @@
+import pytest
+import metrics
+from metrics import Histogram, RequestTimings
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.set_enabled(True)
+    metrics.reset()
+    yield
+    metrics.set_enabled(True)
+    metrics.reset()
+
+def test_histogram_render():
+    hist = Histogram("test_seconds", "Test histogram.", label="stage", buckets=(0.1, 1.0))
+    hist.observe(0.05, "a")
+    hist.observe(0.5, "a")
+    text = hist.render()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 2' in text
+    assert 'test_seconds_count{stage="a"} 2' in text
+
+def test_span_records_stage():
+    with metrics.span("unit.stage"):
+        pass
+    assert 'stage="unit.stage"' in metrics.render_prometheus()
+
+def test_span_disabled_is_noop():
+    metrics.set_enabled(False)
+    with metrics.span("unit.disabled"):
+        pass
+    assert 'stage="unit.disabled"' not in metrics.render_prometheus()
+
+def test_timed_decorator_adds_to_request_timings():
+    @metrics.timed("unit.call")
+    def work():
+        return 42
+
+    timings = RequestTimings()
+    metrics._local.timings = timings
+    try:
+        assert work() == 42
+    finally:
+        metrics._local.timings = None
+    assert "unit.call" in timings.stages
+    assert "unit.call;dur=" in timings.header_value()
+
+def test_metrics_endpoint_and_timing_header():
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['TIMING_HEADER'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    response = client.get('/users')
+    assert "db;count=" in response.headers["X-Timing"]
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b"ride_request_duration_seconds" in response.data
+
+def test_render_sums_snapshots_of_all_processes(tmp_path):
+    import json, os
+    metrics.set_multiproc_dir(str(tmp_path))
+    try:
+        metrics.record_stage("unit.multi", 0.02)
+        # Snapshot left by another worker process.
+        other = {name: [] for name in metrics.REGISTRY}
+        other["ride_stage_duration_seconds"] = [["unit.multi", [0] * 2 + [1] * 9 + [0.5, 1]]]
+        (tmp_path / "metrics-1.json").write_text(json.dumps(other))
+        text = metrics.render_prometheus()
+        assert 'ride_stage_duration_seconds_count{stage="unit.multi"} 2' in text
+        assert (tmp_path / f"metrics-{os.getpid()}.json").exists()
+    finally:
+        metrics.reset()
+        metrics.set_multiproc_dir(None)
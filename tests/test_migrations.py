@@ -0,0 +1,70 @@
+import os
+import sqlite3
+from datetime import datetime
+from flask_migrate import upgrade
+from app import create_app
+from models import db, encode_preferences, AggregationCheckpoint, Driver
+from rating_aggregator import RatingAggregator, CHECKPOINT_NAME
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+# Schema of databases created with db.create_all() before migrations existed.
+LEGACY_SCHEMA = """
+CREATE TABLE user (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, latitude FLOAT NOT NULL,
+    longitude FLOAT NOT NULL, smoking BOOLEAN, music BOOLEAN, pets BOOLEAN, PRIMARY KEY (id));
+CREATE TABLE driver (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, latitude FLOAT NOT NULL,
+    longitude FLOAT NOT NULL, rating FLOAT, is_available BOOLEAN, smoking BOOLEAN, music BOOLEAN,
+    pets BOOLEAN, PRIMARY KEY (id));
+CREATE TABLE admin (id INTEGER NOT NULL, username VARCHAR(100) NOT NULL, password VARCHAR(100) NOT NULL,
+    PRIMARY KEY (id), UNIQUE (username));
+CREATE TABLE rating (id INTEGER NOT NULL, user_id INTEGER NOT NULL, driver_id INTEGER NOT NULL,
+    score FLOAT NOT NULL, timestamp DATETIME, PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES user (id), FOREIGN KEY(driver_id) REFERENCES driver (id));
+"""
+
+def make_legacy_app(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.execute("INSERT INTO user VALUES (1, 'Rider', 52.5, 13.4, 0, 1, 0)")
+    connection.execute("INSERT INTO driver VALUES (1, 'Smoker', 52.5, 13.4, 4.5, 1, 1, 0, 1)")
+    connection.execute("INSERT INTO driver VALUES (2, 'Quiet', 52.5, 13.4, 5.0, 1, 0, 0, 0)")
+    connection.execute("INSERT INTO rating VALUES (1, 1, 1, 4.0, '2024-06-01 12:00:00')")
+    connection.execute("INSERT INTO rating VALUES (2, 1, 1, 5.0, '2024-06-01 12:00:00')")
+    connection.commit()
+    connection.close()
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{path}")
+    return create_app()
+
+def test_upgrade_backfills_preference_profile(tmp_path, monkeypatch):
+    app = make_legacy_app(tmp_path, monkeypatch)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        assert db.session.get(Driver, 1).preference_profile == encode_preferences(True, False, True)
+        assert db.session.get(Driver, 2).preference_profile == encode_preferences(False, False, False)
+
+def test_upgrade_backfills_rating_aggregates(tmp_path, monkeypatch):
+    app = make_legacy_app(tmp_path, monkeypatch)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        driver = db.session.get(Driver, 1)
+        assert (driver.rating, driver.rating_count, driver.rating_sum) == (4.5, 2, 9.0)
+        assert (driver.recent_rating, driver.recent_weight) == (4.5, 2.0)
+        # Stored as naive UTC, comparable with the aggregator's datetime.utcnow().
+        assert abs((datetime.utcnow() - driver.recent_updated_at).total_seconds()) < 60
+        unrated = db.session.get(Driver, 2)
+        assert (unrated.rating, unrated.rating_count, unrated.recent_rating) == (5.0, 0, None)
+        # The existing ratings are already folded in, so the aggregator must not count them again.
+        assert db.session.get(AggregationCheckpoint, CHECKPOINT_NAME).last_id == 2
+        assert RatingAggregator(settle_seconds=0).drain() == 0
+
+def test_upgrade_creates_fresh_schema(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'fresh.db'}")
+    app = create_app()
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        tables = set(db.inspect(db.engine).get_table_names())
+        assert {"user", "driver", "rating", "admin"} <= tables
+        assert "aggregation_checkpoint" in tables
+        columns = {column["name"] for column in db.inspect(db.engine).get_columns("driver")}
+        assert {column.name for column in Driver.__table__.columns} <= columns
@@ -1,5 +1,5 @@
 import pytest
-from models import db, User, Driver, Admin, Rating
+from models import db, User, Driver, Admin, Rating, COMPATIBLE_PROFILES, encode_preferences
 from flask import Flask
 from database import init_db
 
@@ -43,3 +43,21 @@ def test_rating_update(app):
 
         avg = db.session.query(db.func.avg(Rating.score)).filter(Rating.driver_id == driver.id).scalar()
         assert round(avg, 2) == 4.5
+
+def test_compatible_profiles():
+    profile = encode_preferences(smoking=False, music=True, pets=True)
+    compatible = COMPATIBLE_PROFILES[profile]
+    assert len(compatible) == 4
+    assert encode_preferences(False, True, False) in compatible      # 2 of 3 match
+    assert encode_preferences(True, False, True) not in compatible   # 1 of 3 match
+
+def test_driver_preference_profile_synced(app):
+    with app.app_context():
+        driver = Driver(name="Profiled Driver", latitude=40.73061, longitude=-73.935242, smoking=True, music=False, pets=True)
+        db.session.add(driver)
+        db.session.commit()
+        assert driver.preference_profile == encode_preferences(True, False, True)
+
+        driver.music = True
+        db.session.commit()
+        assert driver.preference_profile == encode_preferences(True, True, True)
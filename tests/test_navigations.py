@@ -1,6 +1,11 @@
 import pytest
 import requests
-from navigation import get_route, calculate_optimal_route
+import polyline
+class MockSession:
+    def __init__(self, get):
+        self.get = get
+
+from navigation import get_route, calculate_optimal_route, simplify_geometry, zoom_tolerance
 
 # Base URL for the OSRM API
 OSRM_BASE_URL = "http://router.project-osrm.org"
@@ -10,7 +15,7 @@ def test_get_route(monkeypatch):
     Test the get_route function to ensure it retrieves the correct route information.
     """
 
-    def mock_get(url, params):
+    def mock_get(url, params, timeout=None):
         class MockResponse:
             def __init__(self, json_data, status_code):
                 self.json_data = json_data
@@ -29,8 +34,8 @@ def test_get_route(monkeypatch):
         }
         return MockResponse(mocked_data, 200)
 
-    # Use monkeypatch to replace 'requests.get' with our mock function
-    monkeypatch.setattr(requests, 'get', mock_get)
+    # Use monkeypatch to replace the OSRM session's get with our mock function
+    monkeypatch.setattr('navigation.get_session', lambda: MockSession(mock_get))
 
     start = (13.388860, 52.517037)
     end = (13.397634, 52.529407)
@@ -45,7 +50,7 @@ def test_calculate_optimal_route(monkeypatch):
     Test the calculate_optimal_route function to ensure it calculates the correct combined route.
     """
 
-    def mock_get(url, params):
+    def mock_get(url, params, timeout=None):
         class MockResponse:
             def __init__(self, json_data, status_code):
                 self.json_data = json_data
@@ -64,8 +69,8 @@ def test_calculate_optimal_route(monkeypatch):
         }
         return MockResponse(mocked_data, 200)
 
-    # Use monkeypatch to replace 'requests.get' with our mock function
-    monkeypatch.setattr(requests, 'get', mock_get)
+    # Use monkeypatch to replace the OSRM session's get with our mock function
+    monkeypatch.setattr('navigation.get_session', lambda: MockSession(mock_get))
 
     driver_location = (13.388860, 52.517037)
     passenger_pickup = (13.397634, 52.529407)
@@ -75,3 +80,69 @@ def test_calculate_optimal_route(monkeypatch):
     assert optimal_route['total_distance'] == 2000
     assert optimal_route['total_duration'] == 1200
     assert optimal_route['geometry'] == 'mocked_geometrymocked_geometry'
+
+def make_osrm_mock(geometry, calls):
+    def mock_get(url, params, timeout=None):
+        calls.append(dict(params, timeout=timeout))
+
+        class MockResponse:
+            status_code = 200
+
+            def json(self):
+                return {
+                    'code': 'Ok',
+                    'routes': [{
+                        'distance': 1000,
+                        'duration': 600,
+                        'geometry': geometry,
+                        'legs': [{'steps': [{'name': 'Main St', 'maneuver': {'type': 'depart'}, 'distance': 1000, 'duration': 600}]}]
+                    }]
+                }
+        return MockResponse()
+    return mock_get
+
+def test_get_route_encoded_passthrough(monkeypatch):
+    """
+    The encoded polyline is returned unchanged and steps are not requested by default.
+    """
+    encoded = polyline.encode([(52.5, 13.4), (52.51, 13.41), (52.52, 13.42)])
+    calls = []
+    monkeypatch.setattr('navigation.get_session', lambda: MockSession(make_osrm_mock(encoded, calls)))
+
+    route = get_route((52.5, 13.4), (52.52, 13.42), geometry_format="polyline")
+    assert route['geometry'] == encoded
+    assert 'steps' not in route
+    assert calls[0]['steps'] == "false"
+
+    route = get_route((52.5, 13.4), (52.52, 13.42), steps=True)
+    assert route['geometry'] == polyline.decode(encoded)
+    assert route['steps'][0]['name'] == 'Main St'
+    assert calls[1]['steps'] == "true"
+
+def test_calculate_optimal_route_polyline_legs(monkeypatch):
+    encoded = polyline.encode([(52.5, 13.4), (52.52, 13.42)])
+    monkeypatch.setattr('navigation.get_session', lambda: MockSession(make_osrm_mock(encoded, [])))
+    route = calculate_optimal_route((52.5, 13.4), (52.52, 13.42), (52.53, 13.43), geometry_format="polyline")
+    assert route['geometry'] == [encoded, encoded]
+    assert route['total_distance'] == 2000
+
+def test_route_requests_time_out(monkeypatch):
+    calls = []
+    encoded = polyline.encode([(52.5, 13.4), (52.52, 13.42)])
+    monkeypatch.setattr('navigation.get_session', lambda: MockSession(make_osrm_mock(encoded, calls)))
+    get_route((52.5, 13.4), (52.52, 13.42))
+    calculate_optimal_route((52.5, 13.4), (52.52, 13.42), (52.53, 13.43), timeout=1.5)
+    assert [call['timeout'] for call in calls] == [5.0, 1.5, 1.5]
+
+def test_simplify_geometry():
+    # Nearly straight line with one small wiggle (~1 m) and one large detour (~1 km).
+    points = [(52.5, 13.4), (52.5, 13.401), (52.50001, 13.402), (52.5, 13.403), (52.509, 13.404), (52.5, 13.405)]
+    simplified = simplify_geometry(points, tolerance_m=10)
+    assert simplified == [(52.5, 13.4), (52.5, 13.403), (52.509, 13.404), (52.5, 13.405)]
+    assert simplify_geometry(points, tolerance_m=0) == points
+
+def test_zoom_tolerance():
+    # One pixel at zoom 0 on the equator is ~156 km and halves with each zoom level.
+    assert round(zoom_tolerance(0, 0)) == 156543
+    assert zoom_tolerance(15, 52.5) < zoom_tolerance(14, 52.5)
+
@@ -0,0 +1,141 @@
+import pytest
+from datetime import datetime, timedelta
+from flask import Flask
+from models import db, AggregationCheckpoint, Driver, Rating, User
+from rating_aggregator import RatingAggregator, decay_factor, run_batches, CHECKPOINT_NAME
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+def add_driver(name="Rated Driver"):
+    driver = Driver(name=name, latitude=40.73061, longitude=-73.935242)
+    db.session.add(driver)
+    db.session.commit()
+    return driver.id
+
+def add_ratings(driver_id, scores, timestamp=NOW - timedelta(minutes=5)):
+    db.session.add_all([Rating(user_id=1, driver_id=driver_id, score=s, timestamp=timestamp) for s in scores])
+    db.session.commit()
+
+def test_decay_factor():
+    assert decay_factor(0, 100) == 1.0
+    assert decay_factor(100, 100) == 0.5
+    assert decay_factor(-5, 100) == 1.0  # Clock skew never boosts a rating
+
+def test_aggregates_new_ratings_once(app):
+    with app.app_context():
+        first, second = add_driver(), add_driver("Other Driver")
+        add_ratings(first, [4, 5])
+        add_ratings(second, [3])
+
+        aggregator = RatingAggregator(settle_seconds=0)
+        assert aggregator.run_once(now=NOW) == 3
+        assert aggregator.run_once(now=NOW) == 0  # Watermark already past every rating
+
+        driver = db.session.get(Driver, first)
+        assert (driver.rating, driver.rating_count, driver.rating_sum) == (4.5, 2, 9.0)
+        assert db.session.get(Driver, second).rating == 3.0
+        assert db.session.get(AggregationCheckpoint, CHECKPOINT_NAME).last_id == 3
+
+        add_ratings(first, [3])
+        assert aggregator.run_once(now=NOW) == 1
+        driver = db.session.get(Driver, first)
+        assert (driver.rating, driver.rating_count) == (4.0, 3)
+
+def test_batches_and_settle_window(app):
+    with app.app_context():
+        driver_id = add_driver()
+        add_ratings(driver_id, [5] * 5)
+        add_ratings(driver_id, [1], timestamp=NOW)  # Too fresh to aggregate yet
+
+        aggregator = RatingAggregator(batch_size=2, settle_seconds=60)
+        assert aggregator.run_once(now=NOW) == 2
+        assert aggregator.drain(now=NOW) == 3
+        assert db.session.get(Driver, driver_id).rating_count == 5
+        assert aggregator.drain(now=NOW + timedelta(minutes=2)) == 1
+
+def test_recent_rating_favours_recent_scores(app):
+    with app.app_context():
+        driver_id = add_driver()
+        add_ratings(driver_id, [5], timestamp=NOW - timedelta(days=30))
+        add_ratings(driver_id, [1], timestamp=NOW)
+
+        RatingAggregator(half_life_days=30, settle_seconds=0).drain(now=NOW)
+        driver = db.session.get(Driver, driver_id)
+        assert driver.rating == 3.0
+        # The 30-day-old 5 weighs half as much as today's 1: (0.5 * 5 + 1) / 1.5
+        assert driver.recent_rating == pytest.approx(7 / 3, abs=1e-3)
+
+def test_recent_rating_decays_stored_aggregate(app):
+    with app.app_context():
+        driver_id = add_driver()
+        add_ratings(driver_id, [5], timestamp=NOW)
+        aggregator = RatingAggregator(half_life_days=30, settle_seconds=0)
+        aggregator.drain(now=NOW)
+
+        later = NOW + timedelta(days=30)
+        add_ratings(driver_id, [1], timestamp=later)
+        aggregator.drain(now=later)
+        assert db.session.get(Driver, driver_id).recent_rating == pytest.approx(7 / 3, abs=1e-3)
+
+def test_waits_for_missing_ids(app):
+    with app.app_context():
+        driver_id = add_driver()
+        add_ratings(driver_id, [5, 4, 3], timestamp=NOW)
+        # Rating 2 was flushed but not yet visible, as if its transaction were still open.
+        db.session.delete(db.session.get(Rating, 2))
+        db.session.commit()
+
+        aggregator = RatingAggregator(settle_seconds=0, gap_seconds=60)
+        assert aggregator.drain(now=NOW) == 1  # Stops before the gap
+        assert aggregator.drain(now=NOW + timedelta(minutes=10)) == 1  # Gap is old: id 2 never committed
+        assert db.session.get(Driver, driver_id).rating_count == 2
+
+def test_run_batches_writes_metrics_snapshot(app, tmp_path):
+    import json, os
+    import metrics
+    metrics.reset()
+    metrics.set_multiproc_dir(str(tmp_path))
+    try:
+        with app.app_context():
+            add_ratings(add_driver(), [4, 5])
+            assert run_batches(RatingAggregator(settle_seconds=0)) == 2
+        snapshot = json.loads((tmp_path / f"metrics-{os.getpid()}.json").read_text())
+        assert snapshot["ride_rating_batch_size"][0][1][-1] == 1  # One batch observed
+    finally:
+        metrics.reset()
+        metrics.set_multiproc_dir(None)
+
+def test_rate_driver_endpoint(app):
+    from routes import routes
+    app.register_blueprint(routes)
+    client = app.test_client()
+    with app.app_context():
+        driver_id = add_driver()
+        db.session.add(User(name="Rider", latitude=40.73, longitude=-73.93))
+        db.session.commit()
+
+    response = client.post(f"/rate_driver/{driver_id}", json={"user_id": 1, "rating": 4})
+    assert response.status_code == 202
+    assert response.get_json() == {"message": "Rating submitted successfully", "rating_id": 1,
+                                   "driver_id": driver_id, "current_average_rating": 5.0}
+
+    for body in ({"user_id": 1, "rating": 6}, {"user_id": 1}, {"user_id": 1, "rating": "4"}, {"user_id": 1, "rating": True}):
+        assert client.post(f"/rate_driver/{driver_id}", json=body).status_code == 400, body
+    assert client.post(f"/rate_driver/{driver_id}", json={"user_id": 2, "rating": 4}).status_code == 404
+    assert client.post("/rate_driver/99", json={"user_id": 1, "rating": 4}).status_code == 404
+
+    # The rating only moves the average once the aggregator has folded it in.
+    with app.app_context():
+        RatingAggregator(settle_seconds=0).drain()
+        assert db.session.get(Driver, driver_id).rating == 4.0
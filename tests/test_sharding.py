@@ -0,0 +1,202 @@
+import threading
+import time
+import pytest
+from flask import Flask
+from graphs import Graph, SLOTS_PER_DAY
+from models import encode_preferences
+from sharding import (
+    DriverRecord, ShardClient, ShardMap, ShardMatcher, ShardService, ShardState, ShardUnavailable, ShardedMatcher,
+    build_shard_map, load_road_graph, service_address, service_authkey,
+)
+
+PROFILE = encode_preferences(False, True, True)
+
+def make_records():
+    return [
+        DriverRecord(1, 52.50, 13.30, 5.0, PROFILE),
+        DriverRecord(2, 52.50, 13.40, 5.0, PROFILE),
+        DriverRecord(3, 52.50, 13.50, 5.0, PROFILE),
+        DriverRecord(4, 52.50, 13.60, 5.0, PROFILE),
+    ]
+
+def test_shard_map_from_points():
+    shard_map = ShardMap.from_points([(r.latitude, r.longitude) for r in make_records()], 2)
+    assert shard_map.shard_count == 2
+    assert shard_map.shard_of((52.5, 13.30)) == 0
+    assert shard_map.shard_of((52.5, 13.60)) == 1
+    # The border is at 13.50; a point at 13.49 is about 0.7 km away from shard 1.
+    assert shard_map.distance_to_shard((52.5, 13.30), 0) == 0
+    assert 0.6 < shard_map.distance_to_shard((52.5, 13.49), 1) < 0.7
+
+def test_shard_state_buckets(monkeypatch):
+    monkeypatch.setattr("matcher.get_live_travel_time", lambda start, end, timeout=None: 1)
+    state = ShardState()
+    state.load(make_records())
+    state.upsert(DriverRecord(5, 52.50, 13.401, 5.0, encode_preferences(True, False, False)))  # Incompatible
+
+    score, driver_id, stats = state.match((52.50, 13.401), PROFILE)
+    assert driver_id == 2
+    assert stats["candidates"] == 4
+
+    state.remove(2)
+    _, driver_id, _ = state.match((52.50, 13.401), PROFILE)
+    assert driver_id in (1, 3)
+
+def test_build_shard_map_uses_range_or_all_drivers():
+    from models import db, Driver
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI="sqlite:///:memory:", MATCH_SHARDS=4, MATCH_SHARD_LON_RANGE=None)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        assert build_shard_map(app) is None  # No drivers yet: nothing to place boundaries with
+
+        db.session.add_all([Driver(name=f"D{i}", latitude=52.5, longitude=13.3 + i * 0.1, is_available=i == 0)
+                            for i in range(4)])
+        db.session.commit()
+        # Offline drivers count too, so the strips do not collapse when few are available.
+        assert build_shard_map(app).boundaries == pytest.approx([13.4, 13.5, 13.6])
+
+    app.config["MATCH_SHARD_LON_RANGE"] = "13.0,14.0"
+    assert build_shard_map(app).boundaries == pytest.approx([13.25, 13.5, 13.75])
+
+def test_shard_workers_write_metric_snapshots(tmp_path):
+    import json, os
+    import metrics
+    records = make_records()
+    metrics.set_multiproc_dir(str(tmp_path))  # Inherited by the forked workers
+    try:
+        with ShardedMatcher(ShardMap([]), road_graph=Graph(), eta_source="graph") as service:
+            service.load(records)
+            service.match((52.50, 13.40), PROFILE)
+        snapshots = [path for path in tmp_path.glob("metrics-*.json") if path.name != f"metrics-{os.getpid()}.json"]
+        assert len(snapshots) == 1
+        stages = dict(json.loads(snapshots[0].read_text())["ride_stage_duration_seconds"])
+        assert "match.prescore" in stages
+    finally:
+        metrics.set_multiproc_dir(None)
+
+def test_sharded_matcher_crosses_borders():
+    records = make_records()
+    graph = Graph()
+    points = [(r.latitude, r.longitude) for r in records]
+    for a, b in zip(points, points[1:]):
+        graph.add_edge(a, b, 10)
+
+    shard_map = ShardMap.from_points(points, 2)
+    with ShardedMatcher(shard_map, road_graph=graph, eta_source="graph") as service:
+        assert service.load(records[:2]) == 2  # Shard 1 gets no drivers
+        driver_id, stats = service.match((52.50, 13.59), PROFILE)
+        # Nothing in the user's own shard, so the match must fan out to shard 0.
+        assert driver_id == 2
+        assert stats["shards"] == 2
+
+        service.upsert_driver(records[3])
+        driver_id, _ = service.match((52.50, 13.59), PROFILE)
+        assert driver_id == 4
+
+def test_graph_etas_use_speed_profiles():
+    graph = Graph()
+    a, b = (52.50, 13.40), (52.50, 13.41)
+    graph.add_edge(a, b, 10)
+    matcher = ShardMatcher(road_graph=graph, eta_source="graph")
+    assert matcher.estimate_travel_time(a, b) == 10
+    graph.set_speed_profile(a, b, [0.5] * SLOTS_PER_DAY)  # Half speed all day
+    assert matcher.estimate_travel_time(a, b) == 20
+
+def test_load_road_graph_from_config(tmp_path):
+    graph = Graph()
+    graph.add_edge((52.50, 13.40), (52.50, 13.41), 10)
+    graph.save(tmp_path / "graph.json")
+    app = Flask(__name__)
+    app.config.update(MATCH_ETA_SOURCE="osrm", MATCH_ROAD_GRAPH_PATH=None)
+    assert load_road_graph(app) is None
+
+    app.config["MATCH_ETA_SOURCE"] = "graph"
+    with pytest.raises(ValueError):
+        load_road_graph(app)  # No path
+    app.config["MATCH_ROAD_GRAPH_PATH"] = str(tmp_path / "graph.json")
+    assert load_road_graph(app).a_star((52.50, 13.40), (52.50, 13.41))[1] == 10
+
+def slow_eta(start, end, timeout=None):
+    time.sleep(0.3)
+    return 1
+
+def test_osrm_matches_run_concurrently_in_a_worker(monkeypatch):
+    monkeypatch.setattr("matcher.get_live_travel_time", slow_eta)  # Inherited by the forked worker
+    records = make_records()
+    with ShardedMatcher(ShardMap([]), top_k=1, match_threads=4) as service:
+        service.load(records)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(service.match((52.50, 13.401), PROFILE)))
+                   for _ in range(4)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Four one-lookup matches on a single shard overlap instead of taking 4 x 0.3 s.
+        assert time.perf_counter() - started < 0.9
+        assert [driver_id for driver_id, _ in results] == [2] * 4
+
+def test_timeout_and_dead_worker_raise_shard_unavailable(monkeypatch):
+    monkeypatch.setattr("matcher.get_live_travel_time", slow_eta)
+    with ShardedMatcher(ShardMap([]), top_k=1, timeout=0.1) as service:
+        service.load(make_records())
+        with pytest.raises(ShardUnavailable):
+            service.match((52.50, 13.401), PROFILE)
+        assert service._pending == {}
+
+        service._processes[0].kill()
+        service._processes[0].join()
+        with pytest.raises(ShardUnavailable):
+            service.match((52.50, 13.401), PROFILE)
+
+def test_sync_sends_only_changes():
+    records = make_records()
+    with ShardedMatcher(ShardMap.from_points([(r.latitude, r.longitude) for r in records], 2)) as service:
+        service.load(records)
+        moved = records[0]._replace(rating=3.0)
+        assert service.sync([moved] + records[1:3]) == (1, 1)  # Driver 1 changed, driver 4 is gone
+        assert service.sync([moved] + records[1:3]) == (0, 0)
+
+class FakeMatcher:
+    def match(self, user_location, user_profile):
+        return 7, {"candidates": 1, "osrm_calls": 1, "shards": 1}
+
+def test_shard_client_talks_to_service():
+    service = ShardService(FakeMatcher(), ("127.0.0.1", 0), b"secret")
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    try:
+        client = ShardClient(service.address, b"secret", timeout=5)
+        driver_id, stats = client.match((52.5, 13.4), PROFILE)
+        assert driver_id == 7 and stats["shards"] == 1
+        with pytest.raises(ShardUnavailable):
+            client.upsert_driver(make_records()[0])  # FakeMatcher has no upsert_driver
+    finally:
+        service.close()
+
+def test_shard_client_reports_missing_service():
+    listener = ShardService(FakeMatcher(), ("127.0.0.1", 0), b"secret")
+    address = listener.address
+    listener.close()
+    with pytest.raises(ShardUnavailable):
+        ShardClient(address, b"secret", timeout=1).match((52.5, 13.4), PROFILE)
+
+def test_service_settings_refuse_unsafe_setups():
+    app = Flask(__name__)
+    app.config.update(MATCH_SHARD_ADDRESS="127.0.0.1:6010", MATCH_SHARD_AUTHKEY=None,
+                      SECRET_KEY="your_default_secret_key")
+    with pytest.raises(RuntimeError):
+        service_authkey(app)  # SECRET_KEY is not used as a fallback
+    app.config["MATCH_SHARD_AUTHKEY"] = "s3cret"
+    assert service_authkey(app) == b"s3cret"
+    assert service_address(app) == ("127.0.0.1", 6010)
+
+    app.config["MATCH_SHARD_ADDRESS"] = "0.0.0.0:6010"
+    with pytest.raises(RuntimeError):
+        service_address(app)
+    app.config["MATCH_SHARD_ALLOW_REMOTE"] = True
+    assert service_address(app) == ("0.0.0.0", 6010)
+    with pytest.raises(ValueError):
+        ShardClient(("127.0.0.1", 6010), b"")
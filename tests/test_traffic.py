@@ -9,7 +9,7 @@ class DummyResponse:
     def json(self):
         return self._json_data
 
-def dummy_get(url):
+def dummy_get(url, timeout=None):
     # Return a dummy OSRM response with a duration of 600 seconds (10 minutes)
     dummy_data = {
         "code": "Ok",
@@ -19,10 +19,31 @@ def dummy_get(url):
     }
     return DummyResponse(dummy_data, 200)
 
+class DummySession:
+    def __init__(self, get):
+        self.get = get
+
 def test_get_live_travel_time(monkeypatch):
-    monkeypatch.setattr("traffic.requests.get", dummy_get)
+    monkeypatch.setattr("traffic.get_session", lambda: DummySession(dummy_get))
     start = (40.7128, -74.0060)
     end = (40.73061, -73.935242)
     travel_time = get_live_travel_time(start, end)
     # 600 seconds should convert to 10 minutes
     assert travel_time == 10
+
+def test_get_live_travel_time_times_out(monkeypatch):
+    import requests
+    seen = {}
+    def slow_get(url, timeout=None):
+        seen["timeout"] = timeout
+        raise requests.Timeout("OSRM too slow")
+    monkeypatch.setattr("traffic.get_session", lambda: DummySession(slow_get))
+    assert get_live_travel_time((40.7128, -74.0060), (40.73061, -73.935242), timeout=0.5) is None
+    assert seen["timeout"] == 0.5
+
+def test_session_is_shared_per_process(monkeypatch):
+    import traffic
+    session = traffic.get_session()
+    assert traffic.get_session() is session
+    monkeypatch.setattr("traffic.os.getpid", lambda: -1)  # As seen from a forked child
+    assert traffic.get_session() is not session
@@ -1,19 +1,47 @@
+import os
 import requests
+from metrics import timed
 
-def get_live_travel_time(start_coords, end_coords):
+OSRM_BASE_URL = os.getenv("OSRM_BASE_URL", "http://router.project-osrm.org")
+DEFAULT_TIMEOUT = 2.0  # Seconds to wait for OSRM before treating the call as failed
+POOL_SIZE = int(os.getenv("OSRM_POOL_SIZE", "32"))  # Keep-alive connections per OSRM host and process
+
+_session = None
+_session_pid = None
+
+
+def get_session():
+    """
+    Returns this process's shared requests.Session for OSRM, with a keep-alive connection pool.
+    A process forked from one that already had a session gets a new one: pooled sockets must not
+    be shared between processes.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session, _session_pid = session, os.getpid()
+    return _session
+
+
+@timed("osrm.travel_time")
+def get_live_travel_time(start_coords, end_coords, timeout=DEFAULT_TIMEOUT):
     """
     Fetches dynamic travel time from the OSRM API between two coordinates.
     
     :param start_coords: Tuple (lat, lon) for the start location.
     :param end_coords: Tuple (lat, lon) for the destination location.
-    :return: Estimated travel time in minutes or None if the API call fails.
+    :param timeout: Seconds to wait for OSRM; a slow response counts as a failure.
+    :return: Estimated travel time in minutes or None if the API call fails or times out.
     """
     # OSRM API endpoint expects coordinates in lon,lat order.
-    base_url = "http://router.project-osrm.org/route/v1/driving/{},{};{},{}?overview=false"
+    base_url = OSRM_BASE_URL + "/route/v1/driving/{},{};{},{}?overview=false"
     url = base_url.format(start_coords[1], start_coords[0], end_coords[1], end_coords[0])
     
     try:
-        response = requests.get(url)
+        response = get_session().get(url, timeout=timeout)
         if response.status_code == 200:
             data = response.json()
             # Check that we got a valid response
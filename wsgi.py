@@ -0,0 +1,59 @@
+# wsgi.py
+"""
+Production WSGI entry point.
+
+Builds the app and its long-lived services (the shared RideMatcher, the ETA matrix store, the
+OSRM HTTP session and the modules on the request path) once, in the master process. With gunicorn's preload_app (see
+gunicorn.conf.py) the workers are then forked from this warm state and share its memory
+copy-on-write instead of each importing and building everything again.
+
+Usage:
+    gunicorn -c gunicorn.conf.py
+"""
+
+import gc
+import time
+
+_preload_started = time.perf_counter()
+
+import metrics
+import traffic
+from app import create_app
+from database import db
+from matcher import get_matcher
+import sharding
+
+
+def warm_up(app):
+    """Builds the long-lived services and runs the lazy initialisation done on first use."""
+    with app.app_context():
+        get_matcher(app)
+        eta_store = app.extensions.get("eta_matrix")
+        if eta_store is not None:
+            eta_store.get()
+        # Creates the engine and compiles the metadata now rather than on the first request.
+        db.engine
+    if app.config["MATCH_SHARDS"]:
+        sharding.get_service(app)  # Fails at boot, not per request, if the shard set-up is unsafe
+    traffic.get_session()
+
+
+def after_fork(app):
+    """
+    Per-worker set-up after fork: pooled DB and OSRM connections inherited from the master must
+    not be shared between processes, and cold-start metrics are measured from this point.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    traffic.get_session()  # Replaces the master's session with one owned by this worker
+    metrics.mark_process_start()
+
+
+app = create_app(migrations=False)
+warm_up(app)
+
+# Move everything built so far out of the garbage collector's view, so collections in the
+# workers do not touch (and thereby copy) the preloaded pages.
+gc.freeze()
+
+PRELOAD_SECONDS = time.perf_counter() - _preload_started